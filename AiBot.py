@@ -1,105 +1,1123 @@
 import os
 import discord
 from dotenv import load_dotenv
-from groq import Groq
+from botlog import get_logger
+from groq import APITimeoutError, AsyncGroq, InternalServerError, RateLimitError
 import io
 from datetime import datetime
 import PyPDF2
-from collections import deque  
+import asyncio
+import bisect
+import hashlib
+import heapq
+import math
+import mmap
+import multiprocessing
+import random
+import re
+import sqlite3
+import time
+import unicodedata
+import zlib
+from collections import Counter, deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 load_dotenv()
+log = get_logger("AiBot")
 intents = discord.Intents.default()
 intents.message_content = True  
 bot = discord.Client(intents=intents)
-groq_client = Groq(api_key=os.getenv("Groq_API_Key"))
+groq_client = AsyncGroq(api_key=os.getenv("Groq_API_Key"), max_retries=0)  # retries doet de GroqScheduler zelf
 
 STUDY_CHANNEL_ID = os.getenv("STUDYBOT_CHANNEL")
 
-MAX_HISTORY = 12  
-message_history = deque(maxlen=MAX_HISTORY)  #deue voor historie bijhouden 
+MAX_HISTORY = 12  # Max aantal berichten per gesprek
+SESSION_IDLE_TIMEOUT = 3600  # Gesprekken die zo lang stil zijn worden vergeten (seconden)
+SESSION_MAX_CHARS = 100_000  # Per gesprek: lange berichten duwen enkel de eigen oude berichten weg
+MEMORY_MAX_CHARS = int(os.getenv("AI_MEMORY_MAX_CHARS", 5_000_000))  # Alle gesprekken samen
 
-def extract_text_from_pdf(file_content):# functie voor pdf te kunnen lezen voor de ai
-    text = ""
+# Modellen: naam -> context window (tokens)
+SMALL_MODEL = "llama3-8b-8192"      # Korte, eenvoudige vragen en drukte
+MODEL = "llama3-70b-8192"           # Standaard
+LONG_MODEL = "mixtral-8x7b-32768"   # Prompts die niet in 8k passen
+MODELS = {SMALL_MODEL: 8192, MODEL: 8192, LONG_MODEL: 32768}
+FALLBACK_MODELS = {SMALL_MODEL: MODEL, MODEL: LONG_MODEL, LONG_MODEL: MODEL}  # Bij een timeout of 429 (als de prompt past)
+
+# Routing
+SIMPLE_PROMPT_TOKENS = 400   # Hele prompt zo klein en geen bestanden: klein model
+BUSY_PROMPT_TOKENS = 1500    # Bij een volle wachtrij gaan prompts tot deze grootte naar het kleine model
+SHORT_QUESTION_TOKENS = 40   # Korte vraag: kleiner max_tokens
+RESPONSE_TOKENS_SHORT = 1024
+RESPONSE_TOKENS = 2048       # Ruimte voor het antwoord
+RESPONSE_TOKENS_LONG = 4096
+CONTEXT_MARGIN = 256         # Marge omdat de token telling een schatting is
+GROQ_TIMEOUT = 30            # Seconden voor een request (verbinding/eerste bytes) voor we naar een ander model gaan
+CONTEXT_TOKEN_BUDGET = MODELS[MODEL] - RESPONSE_TOKENS - CONTEXT_MARGIN
+ATTACHMENT_TOKEN_SHARE = 0.6 # Max deel van het budget voor fragmenten uit bijlagen
+SUMMARY_TOKENS = 256         # Budget voor de samenvatting van weggevallen berichten
+
+# Streaming
+STREAM_EDIT_INTERVAL = 1.0   # Min seconden tussen twee edits van een antwoord dat nog binnenkomt (Discord rate limit)
+MAX_MESSAGE_CHARS = 1900     # Langere antwoorden worden als .txt bestand verstuurd
+MAX_REQUESTS_PER_USER = 2    # Zoveel vragen van één gebruiker worden tegelijk beantwoord
+
+active_requests = {}  # user id -> aantal lopende vragen
+
+# Groq quota
+GROQ_MAX_CONCURRENCY = 4     # Zoveel Groq requests tegelijk, de rest wacht in de fair queue
+USER_TOKENS_PER_MINUTE = int(os.getenv("AI_USER_TOKENS_PER_MINUTE", 30_000))    # Token bucket per gebruiker (prompt + antwoord)
+GUILD_TOKENS_PER_MINUTE = int(os.getenv("AI_GUILD_TOKENS_PER_MINUTE", 120_000)) # Token bucket per server
+PRIORITY_WEIGHT = 2          # Gewicht in de fair queue voor leden met Manage Messages (docenten/moderators), anderen 1
+GROQ_MAX_RETRIES = 3         # Pogingen extra na een 429
+GROQ_BACKOFF_BASE = 1.0      # Seconden, verdubbelt per poging (met jitter)
+GROQ_BACKOFF_MAX = 20.0
+
+# Bijlagen
+MAX_DOCUMENT_CHARS = 500_000   # Zoveel tekst per bijlage wordt gelezen en geïndexeerd
+MAX_ATTACHMENT_BYTES = int(os.getenv("AI_MAX_ATTACHMENT_BYTES", 25 * 1024 * 1024))  # Grotere bestanden worden niet gedownload
+PDF_WORKERS = 2              # Processen die PDF's lezen
+PDF_TIMEOUT = 30             # Max seconden per PDF
+PDF_MEMORY_LIMIT = int(os.getenv("AI_PDF_MEMORY_LIMIT", 512 * 1024 * 1024))  # Max geheugen per PDF proces (bytes, enkel Unix)
+EXTRACTION_CACHE_DIR = os.getenv("AI_EXTRACTION_CACHE", "extraction_cache")  # Gelezen PDF tekst, gecomprimeerd per bestand
+EXTRACTION_CACHE_BYTES = int(os.getenv("AI_EXTRACTION_CACHE_BYTES", 200 * 1024 * 1024))  # Max grootte op schijf
+
+pdf_pool = None
+
+# Antwoord cache
+RESPONSE_CACHE_SIZE = 500        # Max aantal bewaarde antwoorden
+RESPONSE_CACHE_TTL = 6 * 3600    # Zo lang blijft een antwoord geldig (seconden)
+RESPONSE_SIMILARITY = float(os.getenv("AI_CACHE_SIMILARITY", 0))  # Optioneel: min cosine similarity voor een bijna-gelijke vraag (bv. 0.93), 0 = enkel exacte treffers
+EMBEDDING_DIMENSIONS = 1024      # Grootte van de gehashte bag-of-words vector
+NEGATIONS = frozenset("niet geen nooit niets niemand nergens zonder not no never nothing without".split())
+
+# Documenten per kanaal
+DOCUMENTS_FILE = os.getenv("AI_DOCUMENTS_DB", "documents.db")
+MAX_CHANNEL_DOCUMENTS = 20   # Oudste bestanden van een kanaal vallen weg
+MAX_INDEXED_CHANNELS = 20    # Zoveel BM25 indexen blijven in het geheugen
+CHUNK_CHARS = 1200           # Grootte van een fragment
+CHUNK_OVERLAP = 200          # Overlap tussen fragmenten zodat een zin op de grens niet verloren gaat
+RETRIEVAL_TOP_K = 5          # Zoveel fragmenten per vraag
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+    de het een en of van in op aan te met voor door over bij naar uit om als dat die dit deze
+    is zijn was waren wordt worden ben bent heb hebt heeft kan kun kunnen moet wil wat wie waar
+    hoe waarom welke er ik je jij u we wij ze zij hij mij me mijn jouw niet geen ook nog wel dan
+    the a an and or of in on at to for with by from is are was were be it this that what how why
+""".split())
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    # Lokale schatting: elk woord/leesteken is minstens één token, lange woorden ongeveer 4 tekens per token
+    return sum(len(piece) // 4 + 1 for piece in TOKEN_PATTERN.findall(text))
+
+def truncate_tokens(text, tokens, budget):
+    if tokens <= budget:
+        return text
+    return text[:int(len(text) * budget / tokens)] + "..."
+
+
+class Conversation:
+    # Historie van één gebruiker in één kanaal
+
+    def __init__(self, key):
+        self.key = key  # (kanaal, gebruiker)
+        self.messages = deque()  # {"role", "content", "tokens"}
+        self.size = 0
+        self.last_used = time.monotonic()
+
+    def append(self, role, content):
+        self.messages.append({"role": role, "content": content, "tokens": count_tokens(content)})
+        self.size += len(content)
+        self.trim()
+
+    def trim(self):
+        while len(self.messages) > 1 and (len(self.messages) > MAX_HISTORY or self.size > SESSION_MAX_CHARS):
+            self.size -= len(self.messages.popleft()["content"])
+
+    def clear(self):
+        self.messages.clear()
+        self.size = 0
+
+
+class ConversationStore:
+    # Gesprekken per (kanaal, gebruiker) met LRU eviction van stille gesprekken en een globale geheugenlimiet
+
+    def __init__(self):
+        self.sessions = OrderedDict()
+        self.size = 0
+
+    def get(self, channel_id, user_id):
+        key = (channel_id, user_id)
+        conversation = self.sessions.get(key)
+        if conversation is None:
+            conversation = self.sessions[key] = Conversation(key)
+        self.sessions.move_to_end(key)
+        conversation.last_used = time.monotonic()
+        return conversation
+
+    def tracked(self, conversation):
+        # Een gesprek kan verwijderd zijn terwijl het antwoord nog streamde: dat telt niet meer mee in het totaal
+        return self.sessions.get(conversation.key) is conversation
+
+    def append(self, conversation, role, content):
+        before = conversation.size
+        conversation.append(role, content)
+        if self.tracked(conversation):
+            self.size += conversation.size - before
+            self.evict(conversation)
+
+    def reset(self, conversation):
+        if self.tracked(conversation):
+            self.size -= conversation.size
+        conversation.clear()
+
+    def evict(self, keep):
+        # Oudste gesprekken eerst: weg als ze te lang stil zijn of als het totaal over de limiet gaat
+        now = time.monotonic()
+        for key, conversation in list(self.sessions.items()):
+            if conversation is keep:
+                continue
+            if self.size <= MEMORY_MAX_CHARS and now - conversation.last_used < SESSION_IDLE_TIMEOUT:
+                break
+            self.size -= conversation.size
+            del self.sessions[key]
+
+
+conversations = ConversationStore()
+
+def build_context(conversation, chunks=(), budget=CONTEXT_TOKEN_BUDGET):
+    # Relevante fragmenten uit de bestanden als system bericht, daarna de nieuwste berichten tot het token budget op is
+    total_budget = budget
+    context = []
+
+    chunk_budget = int(budget * ATTACHMENT_TOKEN_SHARE)
+    chunk_parts = []
+    for name, text in chunks:  # beste fragment eerst
+        if chunk_budget <= 0:
+            break
+        tokens = count_tokens(text)
+        text = truncate_tokens(text, tokens, chunk_budget)
+        chunk_parts.append(f"Uit '{name}':\n{text}")
+        chunk_budget -= min(tokens, chunk_budget)
+    budget -= int(total_budget * ATTACHMENT_TOKEN_SHARE) - chunk_budget
+    if chunk_parts:
+        context.append({"role": "system", "content": "Relevante fragmenten uit de bestanden in dit kanaal:\n\n" + "\n\n".join(chunk_parts)})
+
+    kept = []
+    dropped = []
+    for entry in reversed(conversation.messages):
+        if not kept:
+            # De laatste vraag gaat altijd mee, desnoods ingekort
+            tokens = min(entry["tokens"], budget - SUMMARY_TOKENS)
+            kept.append({"role": entry["role"], "content": truncate_tokens(entry["content"], entry["tokens"], tokens)})
+            budget -= tokens
+        elif not dropped and entry["tokens"] <= budget - SUMMARY_TOKENS:
+            kept.append({"role": entry["role"], "content": entry["content"]})
+            budget -= entry["tokens"]
+        else:
+            dropped.append(entry)
+
+    if dropped:
+        # Oudere berichten die niet meer passen kort samenvatten (enkel de vragen van de gebruiker)
+        questions = [entry["content"][:150].replace("\n", " ") for entry in reversed(dropped) if entry["role"] == "user"]
+        summary = "Eerdere vragen in dit gesprek:\n" + "\n".join(f"- {question}" for question in questions)
+        summary = truncate_tokens(summary, count_tokens(summary), SUMMARY_TOKENS)
+        context.append({"role": "system", "content": summary})
+
+    context.extend(reversed(kept))
+    return context
+
+def extract_text_from_pdf(file_content, limit=MAX_DOCUMENT_CHARS):# functie voor pdf te kunnen lezen voor de ai
+    # Draait in pdf_pool: pagina per pagina lezen en stoppen zodra er genoeg tekst is
+    parts = []
+    length = 0
     try:
         with io.BytesIO(file_content) as pdf_file:
             reader = PyPDF2.PdfReader(pdf_file)
             for page in reader.pages:
-                text += page.extract_text() # tekst uit de pdf halen
+                text = page.extract_text() or "" # tekst uit de pdf halen
+                parts.append(text)
+                length += len(text)
+                if length >= limit:
+                    break
+    except MemoryError:
+        log.error("pdf_extract_memory_limit", limit=PDF_MEMORY_LIMIT)
     except Exception as e:
-        print(f"Fout bij PDF extractie: {e}")
-    return text
+        log.error("pdf_extract_failed", error=e)
+    return "\n".join(parts)[:limit]  # pagina's niet aan elkaar plakken ("normalisatiePagina")
+
+def limit_worker_memory():
+    # Initializer van elk PDF proces: een kapotte of gigantische PDF geeft een MemoryError in plaats van de bot te laten swappen
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (PDF_MEMORY_LIMIT, PDF_MEMORY_LIMIT))
+    except (ImportError, ValueError, OSError):
+        pass  # Windows of een harde limiet die lager ligt: dan enkel de timeout
+
+def get_pdf_pool():
+    # "spawn" zodat de processen niets van de draaiende event loop en threads erven
+    global pdf_pool
+    if pdf_pool is None:
+        pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=limit_worker_memory
+        )
+    return pdf_pool
+
+def kill_pdf_pool(pool):
+    # Een proces dat vastzit op een PDF kan niet geannuleerd worden: de pool stoppen en bij de volgende PDF een nieuwe starten.
+    # Enkel de pool waarop de eigen job liep: een andere job kan ondertussen al een nieuwe pool gestart hebben.
+    global pdf_pool
+    if pool is None or pdf_pool is not pool:
+        return
+    pdf_pool = None
+    # Andere PDF's die nog in deze pool liepen gaan mee verloren (die krijgen een lege tekst)
+    dropped = len(getattr(pool, "_pending_work_items", {})) - 1
+    if dropped > 0:
+        log.warning("pdf_jobs_dropped", count=dropped)
+    for process in list(getattr(pool, "_processes", {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+async def read_pdf(file_content):
+    pool = get_pdf_pool()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(pool, extract_text_from_pdf, file_content)
+        return await asyncio.wait_for(future, PDF_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning("pdf_extract_timeout", timeout=PDF_TIMEOUT, size=len(file_content))
+        kill_pdf_pool(pool)
+    except BrokenProcessPool as e:
+        # Een proces is gestorven (bv. door de geheugenlimiet): zonder nieuwe pool faalt elke volgende PDF
+        log.error("pdf_pool_broken", error=e)
+        kill_pdf_pool(pool)
+    except Exception as e:
+        log.error("pdf_extract_failed", error=e)
+    return ""
 
 def extract_text_from_txt(file_content): #tekst uit .txt bestand halen 
     try:
         return file_content.decode('utf-8') #naar utf 8 decoderen 
     except Exception as e:
-        print(f"Fout bij TXT extractie: {e}")
+        log.error("txt_extract_failed", error=e)
         return ""
 
+class ExtractionCache:
+    # Tekst van eerder gelezen PDF's op schijf: <sha256 van het bestand>.z met zlib, LRU op basis van de mtime.
+    # Bestandsoperaties gebeuren op één eigen thread; de index (OrderedDict) wordt enkel op de event loop aangepast.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # sha256 -> grootte op schijf, oudst gebruikt eerst
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction")
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + ".z")
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".z"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-2], stat.st_size))
+        return sorted(found)
+
+    def _read(self, digest):
+        path = self.path(digest)
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = zlib.decompress(data).decode("utf-8")
+        os.utime(path)  # mtime = laatst gebruikt, zodat de LRU volgorde een herstart overleeft
+        return text
+
+    def _write(self, digest, text):
+        path = self.path(digest)
+        data = zlib.compress(text.encode("utf-8"), 6)
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+        return len(data)
+
+    def _remove(self, digests):
+        for digest in digests:
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                pass
+
+    async def load(self):
+        # Warme start: de index opbouwen uit wat er al op schijf staat
+        for mtime, digest, size in await self.run(self._scan):
+            self.entries[digest] = size
+            self.size += size
+        await self.evict()
+        log.info("extraction_cache_loaded", entries=len(self.entries), bytes=self.size)
+
+    async def get(self, digest):
+        if digest not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            text = await self.run(self._read, digest)
+        except (OSError, ValueError, zlib.error) as e:
+            log.warning("extraction_cache_read_failed", digest=digest, error=e)
+            self.size -= self.entries.pop(digest, 0)
+            await self.run(self._remove, [digest])
+            self.misses += 1
+            return None
+        if digest in self.entries:
+            self.entries.move_to_end(digest)
+        self.hits += 1
+        return text
+
+    async def put(self, digest, text):
+        try:
+            size = await self.run(self._write, digest, text)
+        except OSError as e:
+            log.warning("extraction_cache_write_failed", digest=digest, error=e)
+            return
+        self.size += size - self.entries.pop(digest, 0)
+        self.entries[digest] = size
+        await self.evict()
+
+    async def evict(self):
+        removed = []
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            digest, size = self.entries.popitem(last=False)
+            self.size -= size
+            removed.append(digest)
+        if removed:
+            await self.run(self._remove, removed)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_BYTES)
+
+async def read_pdf_cached(file_content):
+    # Hetzelfde bestand opnieuw geüpload: de tekst uit de cache i.p.v. opnieuw parsen
+    digest = hashlib.sha256(file_content).hexdigest()
+    text = await extraction_cache.get(digest)
+    if text is None:
+        text = await read_pdf(file_content)
+        if text:
+            await extraction_cache.put(digest, text)
+    return text
+
 async def process_attachments(message): # functie voor te kijken of bijlagen pdf of txt zijn en deze te verwerken
     extracted_texts = []
     for attachment in message.attachments:
+        if attachment.size > MAX_ATTACHMENT_BYTES:
+            log.warning("attachment_too_large", filename=attachment.filename, size=attachment.size)
+            continue
         if attachment.filename.lower().endswith('.pdf'):
             file_content = await attachment.read()
-            text = extract_text_from_pdf(file_content)
+            text = await read_pdf_cached(file_content)
             if text:
-                extracted_texts.append(f"PDF-bestand '{attachment.filename}':\n{text[:20000]}...")
+                extracted_texts.append((attachment.filename, text))
         elif attachment.filename.lower().endswith('.txt'):
             file_content = await attachment.read()
             text = extract_text_from_txt(file_content)
             if text:
-                extracted_texts.append(f"Tekstbestand '{attachment.filename}':\n{text[:20000]}...")
-    return "\n\n".join(extracted_texts) if extracted_texts else None
+                extracted_texts.append((attachment.filename, text[:MAX_DOCUMENT_CHARS]))
+    return extracted_texts
+
+def chunk_text(text):
+    # Fragmenten van ongeveer CHUNK_CHARS, bij voorkeur geknipt op een witregel of spatie
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + CHUNK_CHARS, len(text))
+        if end < len(text):
+            cut = text.rfind("\n", start + CHUNK_CHARS // 2, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + CHUNK_CHARS // 2, end)
+            if cut != -1:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - CHUNK_OVERLAP, start + 1)
+    return chunks
+
+def index_terms(text):
+    return [word for word in re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold())
+            if len(word) > 1 and word not in STOPWORDS]
+
+
+class BM25Index:
+    # Okapi BM25 over de fragmenten van één kanaal: postings per term, de idf wordt pas bij het zoeken berekend
+
+    def __init__(self):
+        self.chunks = []    # (bestandsnaam, tekst)
+        self.lengths = []   # aantal termen per fragment
+        self.postings = {}  # term -> {fragment index: term frequency}
+        self.total_length = 0
+
+    def add(self, name, text):
+        terms = index_terms(text)
+        index = len(self.chunks)
+        self.chunks.append((name, text))
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, frequency in Counter(terms).items():
+            self.postings.setdefault(term, {})[index] = frequency
+
+    def search(self, query, k):
+        if not self.chunks:
+            return []
+        count = len(self.chunks)
+        average = self.total_length / count or 1
+        scores = {}
+        for term in set(index_terms(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for index, frequency in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[index] / average)
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.chunks[index] for index, score in best]
+
+
+class DocumentStore:
+    # SQLite op één eigen thread: geüploade bestanden per kanaal, opgesplitst in fragmenten.
+    # De BM25 index van een kanaal wordt bij de eerste vraag uit de database opgebouwd en daarna bijgewerkt.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            UNIQUE (channel_id, hash)
+        );
+
+        CREATE TABLE IF NOT EXISTS chunks (
+            document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (document_id, position)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="documents")
+        self.indexes = OrderedDict()  # channel id -> BM25Index
+        self.versions = {}            # channel id -> teller, zodat een index die tijdens het laden veroudert niet bewaard wordt
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _open(self):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(self.SCHEMA)
+        self.connection.commit()
+
+    def _add(self, channel_id, name, digest, chunks):
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO documents (channel_id, name, hash, created_at) VALUES (?, ?, ?, ?)",
+            (channel_id, name, digest, time.time()))
+        if not cursor.rowcount:
+            return False, False  # hetzelfde bestand staat al in dit kanaal
+        document_id = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO chunks (document_id, position, text) VALUES (?, ?, ?)",
+            [(document_id, position, chunk) for position, chunk in enumerate(chunks)])
+        evicted = self.connection.execute(
+            "DELETE FROM documents WHERE channel_id = ? AND id NOT IN "
+            "(SELECT id FROM documents WHERE channel_id = ? ORDER BY id DESC LIMIT ?)",
+            (channel_id, channel_id, MAX_CHANNEL_DOCUMENTS)).rowcount
+        self.connection.commit()
+        return True, evicted > 0
+
+    def _load(self, channel_id):
+        return self.connection.execute(
+            "SELECT documents.name, chunks.text FROM chunks JOIN documents ON documents.id = chunks.document_id "
+            "WHERE documents.channel_id = ? ORDER BY documents.id, chunks.position",
+            (channel_id,)).fetchall()
+
+    def _clear(self, channel_id):
+        count = self.connection.execute("DELETE FROM documents WHERE channel_id = ?", (channel_id,)).rowcount
+        self.connection.commit()
+        return count
+
+    async def open(self):
+        await self.run(self._open)
+
+    async def close(self):
+        if self.connection is not None:
+            await self.run(self.connection.close)
+        self.executor.shutdown(wait=False)
+
+    def invalidate(self, channel_id):
+        self.versions[channel_id] = self.versions.get(channel_id, 0) + 1
+        self.indexes.pop(channel_id, None)
+
+    async def index(self, channel_id):
+        index = self.indexes.get(channel_id)
+        if index is None:
+            version = self.versions.get(channel_id, 0)
+            index = BM25Index()
+            for name, text in await self.run(self._load, channel_id):
+                index.add(name, text)
+            if self.versions.get(channel_id, 0) != version:
+                return index  # intussen gewijzigd: deze keer gebruiken, de volgende vraag laadt opnieuw
+            self.indexes[channel_id] = index
+            while len(self.indexes) > MAX_INDEXED_CHANNELS:
+                self.indexes.popitem(last=False)
+        self.indexes.move_to_end(channel_id)
+        return index
+
+    async def add_document(self, channel_id, name, text):
+        # Geeft de fragmenten terug, of None als het bestand al in het kanaal stond
+        chunks = chunk_text(text)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        added, evicted = await self.run(self._add, channel_id, name, digest, chunks)
+        if not added:
+            return None
+        index = self.indexes.get(channel_id)
+        if evicted or index is None:
+            self.invalidate(channel_id)
+        else:
+            for chunk in chunks:
+                index.add(name, chunk)
+        log.info("document_indexed", channel=channel_id, name=name, chunks=len(chunks))
+        return [(name, chunk) for chunk in chunks]
+
+    async def search(self, channel_id, query, k=RETRIEVAL_TOP_K):
+        return (await self.index(channel_id)).search(query, k)
+
+    async def clear(self, channel_id):
+        count = await self.run(self._clear, channel_id)
+        self.invalidate(channel_id)
+        return count
+
+
+documents = DocumentStore(DOCUMENTS_FILE)
+
+def normalize_prompt(text):
+    # Hoofdletters, leestekens en extra spaties maken geen verschil voor de vraag
+    return " ".join(re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold()))
+
+def embed_prompt(normalized):
+    # Lokale "embedding": woorden en woordparen gehasht in een vaste vector (sparse dict), genormaliseerd op lengte 1
+    words = normalized.split()
+    vector = {}
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        index = zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIMENSIONS
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = sum(value * value for value in vector.values()) ** 0.5 or 1.0
+    return {index: value / norm for index, value in vector.items()}
+
+def guard_tokens(normalized):
+    # Getallen en ontkenningen moeten exact gelijk zijn: "hoofdstuk 2" is niet "hoofdstuk 5", "niet altijd" niet "altijd"
+    return sorted(word for word in normalized.split() if word in NEGATIONS or any(char.isdigit() for char in word))
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+def cache_scope(conversation, model, chunks):
+    # Alles behalve de vraag zelf: model, de opgehaalde fragmenten en het gesprek ervoor
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for name, text in chunks:
+        digest.update(f"\0{name}\0{text}".encode("utf-8"))
+    for entry in list(conversation.messages)[:-1]:
+        digest.update(f"\0{entry['role']}\0{entry['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    # LRU cache met TTL: (scope, genormaliseerde vraag) -> antwoord, met optioneel bijna-gelijke vragen binnen dezelfde scope
+
+    def __init__(self, maxsize, ttl, similarity):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self.entries = OrderedDict()  # key -> (scope, vector, antwoord, expires)
+        self.scopes = {}              # scope -> keys, zodat de similarity enkel vergelijkbare vragen overloopt
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, scope, question):
+        normalized = normalize_prompt(question)
+        key = (scope, normalized)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[3] < now:
+            self.remove(key)
+            entry = None
+        if entry is None and self.similarity > 0:
+            vector = embed_prompt(normalized)
+            guard = guard_tokens(normalized)
+            best = self.similarity
+            for candidate in list(self.scopes.get(scope, ())):
+                candidate_entry = self.entries[candidate]
+                if candidate_entry[3] < now:
+                    self.remove(candidate)
+                    continue
+                if guard_tokens(candidate[1]) != guard:
+                    continue
+                score = cosine(vector, candidate_entry[1])
+                if score >= best:
+                    best, key, entry = score, candidate, candidate_entry
+            if entry is not None:
+                self.similar_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, scope, question, antwoord):
+        normalized = normalize_prompt(question)
+        key = (scope, normalized)
+        self.remove(key)
+        self.entries[key] = (scope, embed_prompt(normalized) if self.similarity > 0 else None, antwoord, time.monotonic() + self.ttl)
+        self.scopes.setdefault(scope, set()).add(key)
+        while len(self.entries) > self.maxsize:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.scopes[entry[0]]
+        keys.discard(key)
+        if not keys:
+            del self.scopes[entry[0]]
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_SIMILARITY)
+
+class TokenBucket:
+    # Vult continu aan tot capacity; een request kost zijn geschatte aantal tokens
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per seconde
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost, now):
+        # Seconden tot er genoeg tokens zijn (een request groter dan de bucket wacht op een volle bucket)
+        self.refill(now)
+        missing = min(cost, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+
+class GroqScheduler:
+    # Weighted fair queue voor de Groq requests, met token buckets per gebruiker en per server.
+    # Elke vraag krijgt een virtuele eindtijd (start + kost / gewicht): wie veel of grote vragen stelt schuift achteruit,
+    # en een gebruiker of server zonder tokens blokkeert de anderen niet.
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.active = 0
+        self.waiting = []     # [finish, volgnummer, start, user id, guild id, kost, future]
+        self.virtual_time = 0.0
+        self.finish = {}      # user id -> virtuele eindtijd van zijn laatste vraag
+        self.user_buckets = {}
+        self.guild_buckets = {}
+        self.sequence = 0
+        self.wakeup = None
+        self.dispatched = 0
+        self.rate_limited = 0
+
+    def bucket(self, buckets, key, per_minute):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) > 1000:  # volle (= inactieve) buckets opruimen
+                now = time.monotonic()
+                for old_key, old in list(buckets.items()):
+                    if old.delay(old.capacity, now) == 0:
+                        del buckets[old_key]
+            bucket = buckets[key] = TokenBucket(per_minute / 60, per_minute)
+        return bucket
+
+    def submit(self, user_id, guild_id, cost, weight=1):
+        start = max(self.virtual_time, self.finish.get(user_id, 0.0))
+        finish = start + cost / weight
+        self.finish[user_id] = finish
+        self.sequence += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append([finish, self.sequence, start, user_id, guild_id, cost, future])
+        self.dispatch()
+        return future
+
+    def position(self, future):
+        ordered = sorted(self.waiting, key=lambda entry: (entry[0], entry[1]))
+        for position, entry in enumerate(ordered, 1):
+            if entry[6] is future:
+                return position
+        return 0
+
+    def dispatch(self):
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+            self.wakeup = None
+        now = time.monotonic()
+        retry_in = None
+        for entry in sorted(self.waiting, key=lambda entry: (entry[0], entry[1])):
+            if self.active >= self.slots:
+                break
+            finish, sequence, start, user_id, guild_id, cost, future = entry
+            if future.done():  # geannuleerd terwijl hij wachtte
+                self.waiting.remove(entry)
+                continue
+            user_bucket = self.bucket(self.user_buckets, user_id, USER_TOKENS_PER_MINUTE)
+            guild_bucket = self.bucket(self.guild_buckets, guild_id, GUILD_TOKENS_PER_MINUTE)
+            delay = max(user_bucket.delay(cost, now), guild_bucket.delay(cost, now))
+            if delay > 0:
+                retry_in = delay if retry_in is None else min(retry_in, delay)
+                continue
+            user_bucket.take(cost)
+            guild_bucket.take(cost)
+            self.waiting.remove(entry)
+            self.virtual_time = max(self.virtual_time, start)
+            self.active += 1
+            self.dispatched += 1
+            future.set_result(None)
+        if retry_in is not None and self.active < self.slots:
+            self.wakeup = asyncio.get_running_loop().call_later(retry_in, self.dispatch)
+
+    def release(self):
+        self.active -= 1
+        self.dispatch()
+
+    async def wait(self, future, notify=None):
+        # Wachten op een slot; wie geannuleerd wordt of faalt geeft zijn plaats (of zijn slot) terug.
+        # notify(positie) draait binnen dezelfde bescherming, want het slot kan intussen al toegekend zijn.
+        notice = None
+        try:
+            if notify is not None and not future.done():
+                notice = await notify(self.position(future))
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                self.dispatch()
+            raise
+        return notice
+
+
+groq_scheduler = GroqScheduler(GROQ_MAX_CONCURRENCY)
+
+def retry_delay(error, attempt):
+    # Retry-After van Groq respecteren als die er is, anders exponentiële backoff met full jitter
+    try:
+        retry_after = float(error.response.headers.get("retry-after"))
+        return retry_after + random.uniform(0, 1)
+    except (AttributeError, TypeError, ValueError):
+        return random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt))
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)  # Seconden, bovengrenzen van de histogram buckets
+
+
+class LatencyHistogram:
+    # Vaste buckets: goedkoop bij te houden en genoeg om p50/p95 te schatten voor het afstellen van de routing
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, fraction):
+        # Bovengrens van de bucket waarin het percentiel valt
+        if not self.count:
+            return "-"
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return f"≤{LATENCY_BUCKETS[index]}s" if index < len(LATENCY_BUCKETS) else f">{LATENCY_BUCKETS[-1]}s"
+        return "-"
+
+    def format(self):
+        labels = [f"≤{bound}" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}"]
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+
+
+class ModelStats:
+    def __init__(self):
+        self.requests = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.failovers = 0     # requests die van dit model naar een ander gingen
+        self.prompt_tokens = 0
+        self.first_token = LatencyHistogram()
+        self.total = LatencyHistogram()
+
+
+model_stats = {model: ModelStats() for model in MODELS}
+
+def route(conversation, chunks):
+    # Model en max_tokens kiezen op basis van de grootte van de prompt en de drukte in de wachtrij
+    demand = sum(entry["tokens"] for entry in conversation.messages) + sum(count_tokens(text) for name, text in chunks)
+    question_tokens = conversation.messages[-1]["tokens"] if conversation.messages else 0
+    if not chunks and demand <= SIMPLE_PROMPT_TOKENS:
+        model = SMALL_MODEL
+    elif len(groq_scheduler.waiting) >= GROQ_MAX_CONCURRENCY and demand <= BUSY_PROMPT_TOKENS:
+        model = SMALL_MODEL
+    elif demand > CONTEXT_TOKEN_BUDGET:
+        model = LONG_MODEL
+    else:
+        model = MODEL
+    if model == LONG_MODEL:
+        response_tokens = RESPONSE_TOKENS_LONG
+    elif question_tokens <= SHORT_QUESTION_TOKENS and not chunks:
+        response_tokens = RESPONSE_TOKENS_SHORT
+    else:
+        response_tokens = RESPONSE_TOKENS
+    return model, response_tokens
+
+def context_budget(model, response_tokens):
+    return MODELS[model] - response_tokens - CONTEXT_MARGIN
+
+async def create_stream(context, model, response_tokens, prompt_tokens):
+    # Eerst het gekozen model; bij een timeout, 429 of overbelasting meteen het fallback model (als de prompt past).
+    # Falen beide, dan backoff en opnieuw.
+    models = [model]
+    fallback = FALLBACK_MODELS.get(model)
+    if fallback and prompt_tokens + min(response_tokens, RESPONSE_TOKENS) <= MODELS[fallback] - CONTEXT_MARGIN:
+        models.append(fallback)
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        for candidate in models:
+            stats = model_stats[candidate]
+            started = time.monotonic()
+            try:
+                stream = await groq_client.chat.completions.create(
+                    model=candidate,
+                    messages=context,
+                    max_tokens=min(response_tokens, MODELS[candidate] - prompt_tokens - CONTEXT_MARGIN),
+                    stream=True,
+                    timeout=GROQ_TIMEOUT
+                )
+            except (RateLimitError, APITimeoutError, InternalServerError) as e:
+                error = e
+                if isinstance(e, RateLimitError):
+                    stats.rate_limited += 1
+                    groq_scheduler.rate_limited += 1
+                else:
+                    stats.timeouts += 1
+                if candidate != models[-1]:
+                    stats.failovers += 1
+                    log.warning("groq_failover", model=candidate, fallback=models[-1], error=type(e).__name__)
+                continue
+            stats.requests += 1
+            stats.prompt_tokens += prompt_tokens
+            return stream, candidate, started
+        if attempt == GROQ_MAX_RETRIES:
+            raise error
+        delay = retry_delay(error, attempt)
+        log.warning("groq_rate_limited", attempt=attempt + 1, delay=round(delay, 2))
+        await asyncio.sleep(delay)
+
+async def stream_answer(message, context, model, response_tokens, prompt_tokens, reply=None):
+    # Antwoord token per token binnenhalen en het bericht hoogstens om de STREAM_EDIT_INTERVAL bijwerken
+    stream, model, started = await create_stream(context, model, response_tokens, prompt_tokens)
+    stats = model_stats[model]
+    parts = []
+    shown = ""
+    last_edit = 0.0
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        if not parts:
+            stats.first_token.observe(time.monotonic() - started)
+        parts.append(delta)
+        if time.monotonic() - last_edit < STREAM_EDIT_INTERVAL:
+            continue
+        preview = "".join(parts)[:MAX_MESSAGE_CHARS] + " ▌"
+        if reply is None:
+            reply = await message.reply(preview)  # eerste token: meteen iets tonen
+        elif preview != shown:
+            await reply.edit(content=preview)
+        shown = preview
+        last_edit = time.monotonic()
+    stats.total.observe(time.monotonic() - started)
+    return reply, "".join(parts)
+
+async def send_answer(message, reply, antwoord):
+    # Het gestreamde bericht afwerken met het volledige antwoord
+    if len(antwoord) > MAX_MESSAGE_CHARS: # als het antwoord te lang is, sla het op in een txt bestand en verstuur ddat
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        discord_file = discord.File(io.BytesIO(antwoord.encode("utf-8")), filename=f"antwoord_{timestamp}.txt")
+        if reply is None:
+            await message.reply("Hier is mijn uitgebreide antwoord:", file=discord_file)
+        else:
+            await reply.edit(content="Hier is mijn uitgebreide antwoord:", attachments=[discord_file])
+    elif reply is None:
+        await message.reply(antwoord)
+    else:
+        await reply.edit(content=antwoord)
+
+def format_model_stats():
+    lines = []
+    for model, stats in model_stats.items():
+        average = stats.prompt_tokens // stats.requests if stats.requests else 0
+        lines.append(f"{model}: {stats.requests} requests, gem. prompt {average} tokens, "
+                     f"429: {stats.rate_limited}, timeouts: {stats.timeouts}, failovers: {stats.failovers}")
+        lines.append(f"  eerste token p50 {stats.first_token.percentile(0.5)} p95 {stats.first_token.percentile(0.95)} | {stats.first_token.format()}")
+        lines.append(f"  volledig     p50 {stats.total.percentile(0.5)} p95 {stats.total.percentile(0.95)} | {stats.total.format()}")
+    lines.append(f"wachtrij: {len(groq_scheduler.waiting)} wachtend, {groq_scheduler.active} actief, "
+                 f"{groq_scheduler.dispatched} verstuurd, {groq_scheduler.rate_limited} keer 429")
+    lines.append(f"antwoord cache: {response_cache.hits} hits ({response_cache.similar_hits} bijna-gelijk), {response_cache.misses} misses")
+    return "```\n" + "\n".join(lines) + "\n```"
+
+async def answer(message, conversation, user_input):
+    # Eén vraag beantwoorden; on_message houdt bij hoeveel vragen een gebruiker tegelijk open heeft
+    question = user_input
+    uploaded = []
+    if message.attachments: ## voor het verwerken van bijlagen, ze worden in de documenten van het kanaal geïndexeerd en enkel bij naam vermeld
+        for filename, text in await process_attachments(message):
+            uploaded.extend(await documents.add_document(message.channel.id, filename, text) or ())
+            user_input += f"\n\n(Bijlage: {filename})"
+    
+    conversations.append(conversation, "user", user_input)
+
+    # Enkel de fragmenten die bij de vraag passen gaan mee; zonder treffer het begin van een net geüpload bestand
+    chunks = await documents.search(message.channel.id, question) if question else []
+    if not chunks:
+        chunks = uploaded[:RETRIEVAL_TOP_K]
+
+    model, response_tokens = route(conversation, chunks)
+
+    # Dezelfde vraag met dezelfde fragmenten: antwoord uit de cache, zonder Groq request
+    scope = cache_scope(conversation, model, chunks)
+    antwoord = response_cache.get(scope, question)
+    if antwoord is not None:
+        log.debug("response_cache_hit", user=message.author.id)
+        conversations.append(conversation, "assistant", antwoord)
+        await send_answer(message, None, antwoord)
+        return
+
+    context = build_context(conversation, chunks, context_budget(model, response_tokens))
+    prompt_tokens = sum(count_tokens(entry["content"]) for entry in context)
+    cost = prompt_tokens + response_tokens
+    permissions = getattr(message.author, "guild_permissions", None)
+    weight = PRIORITY_WEIGHT if permissions is not None and permissions.manage_messages else 1
+    ticket = groq_scheduler.submit(message.author.id, message.guild.id if message.guild else 0, cost, weight)
+
+    async def notify(position):
+        try:
+            return await message.reply(f"⏳ Het is druk, je vraag staat op plaats {position} in de wachtrij.")
+        except discord.HTTPException:
+            return None  # zonder melding gewoon verder wachten
+
+    notice = await groq_scheduler.wait(ticket, notify)
+
+    try:
+        async with message.channel.typing():
+            # async + streaming: de event loop blijft vrij en de gebruiker ziet het antwoord groeien
+            reply, antwoord = await stream_answer(message, context, model, response_tokens, prompt_tokens, notice)
+            
+            conversations.append(conversation, "assistant", antwoord)
+            if antwoord:
+                response_cache.set(scope, question, antwoord)
+            await send_answer(message, reply, antwoord)
+                
+    except Exception as e:
+        if notice is not None:
+            await notice.edit(content=f"⚠️ Fout: {str(e)}")
+        else:
+            await message.reply(f"⚠️ Fout: {str(e)}")
+    finally:
+        groq_scheduler.release()
+
+@bot.event
+async def setup_hook():
+    await documents.open()
+    await extraction_cache.load()
 
 @bot.event
 async def on_ready():
-    print(f'Bot is ingelogd als {bot.user}')
+    log.info("ready", user=bot.user)
 
 @bot.event
 async def on_message(message):
     
     if bot.user.mentioned_in(message):
         user_input = message.content.replace(f'<@{bot.user.id}>', '').strip()
-        
+        conversation = conversations.get(message.channel.id, message.author.id)
         
         if "nieuw onderwerp" in user_input.lower():# reset de historie voor van nul te beginnen
-            message_history.clear()
+            conversations.reset(conversation)
             await message.reply("🔄 Oké, ik begin met een schone lei!")
             return
+
+        if user_input.lower() == "modelstats": # latency per model, om de routing af te stellen
+            await message.reply(format_model_stats())
+            return
+
+        if message.guild is not None and "vergeet bestanden" in user_input.lower(): # alle geüploade bestanden van dit kanaal verwijderen
+            if not message.author.guild_permissions.manage_messages: # raakt het hele kanaal, dus enkel voor moderators
+                await message.reply("⛔ Enkel moderators kunnen de bestanden van dit kanaal laten vergeten.")
+                return
+            count = await documents.clear(message.channel.id)
+            await message.reply(f"🗑️ {count} bestand(en) van dit kanaal vergeten.")
+            return
         
-        attachment_text = "" ## voor het verwerken van bijlagen
-        if message.attachments:
-            attachment_text = await process_attachments(message)
-            if attachment_text:
-                user_input += f"\n\nHier is de inhoud van de bijgevoegde bestanden:\n{attachment_text}"
-        
-        
-        message_history.append({"role": "user", "content": user_input})
+        if active_requests.get(message.author.id, 0) >= MAX_REQUESTS_PER_USER:
+            await message.reply("⏳ Even geduld, ik ben nog bezig met je vorige vragen.")
+            return
+        active_requests[message.author.id] = active_requests.get(message.author.id, 0) + 1
+        try:
+            await answer(message, conversation, user_input)
+        finally:
+            active_requests[message.author.id] -= 1
+            if not active_requests[message.author.id]:
+                del active_requests[message.author.id]
 
-        async with message.channel.typing():
-            try:
-               
-                response = groq_client.chat.completions.create(
-                    model="llama3-70b-8192",
-                    messages=list(message_history),  
-                    max_tokens=4000
-                )
-                
-                antwoord = response.choices[0].message.content
-                
-               
-                message_history.append({"role": "assistant", "content": antwoord})
-
-                if len(antwoord) > 1900: # als het antwoord te lang is, sla het op in een txt bestand en verstuur ddat
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"antwoord_{timestamp}.txt"
-                    file = io.StringIO(antwoord)
-                    discord_file = discord.File(file, filename=filename)
-                    await message.reply("Hier is mijn uitgebreide antwoord:", file=discord_file)
-                else:
-                    await message.reply(antwoord)
-                    
-            except Exception as e:
-                await message.reply(f"⚠️ Fout: {str(e)}")
+@bot.event
+async def close():
+    if pdf_pool is not None:
+        pdf_pool.shutdown(wait=False, cancel_futures=True)
+    await groq_client.close()
+    await documents.close()
+    extraction_cache.close()
+    await discord.Client.close(bot)
 
-bot.run(os.getenv("Discord_StudyBot_Token"))
\ No newline at end of file
+if __name__ == "__main__": # de PDF processen importeren dit bestand opnieuw, die mogen de bot niet starten
+    bot.run(os.getenv("Discord_StudyBot_Token"), log_handler=None)
\ No newline at end of file
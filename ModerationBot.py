@@ -1,8 +1,10 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-from azure.ai.contentsafety import ContentSafetyClient
+from botlog import get_logger
+from azure.ai.contentsafety.aio import ContentSafetyClient
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import HttpResponseError
 import datetime
@@ -14,16 +16,29 @@ from azure.ai.contentsafety.models import (
     TextCategory,
     ImageCategory
 )
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
 import asyncio
+import hashlib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import time
+import unicodedata
 
 
 load_dotenv()
 token = os.getenv("Discord_ModeratorBot_Token")
+log = get_logger("ModerationBot")
 
 
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = True  # Nodig voor on_member_join (raid detectie)
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 GUILD_ID = int(os.getenv("GUILD_ID", 0))  
@@ -35,10 +50,98 @@ MSG_THRESHOLD = 3    # Na 3 berichten -> slowmode
 TIME_WINDOW = 5      # Binnen 5 seconden
 SLOWMODE_DURATION = 5  # Slowmode duur (seconden)
 NORMAL_SLOWMODE = 0   # Standaard slowmode (0 = uit)
+SLOWMODE_LEVELS = [      # (berichten binnen TIME_WINDOW, slowmode delay) -> hoe drukker, hoe trager
+    (MSG_THRESHOLD, SLOWMODE_DURATION),
+    (8, 10),
+    (15, 30),
+    (30, 60),
+]
+SLOWMODE_HOLD = 15       # Zo lang moet het rustig blijven voor we een niveau zakken (seconden)
+SLOWMODE_LOW_RATIO = 0.5 # Rustig = minder dan de helft van de drempel van het huidige niveau
+EDIT_MIN_INTERVAL = 15   # Min tijd tussen twee channel edits per kanaal (Discord rate limit)
+
+# Raid detectie
+RAID_JOIN_RATE = 0.2         # Joins per seconde (~10 joins in een halve minuut) -> lockdown
+RAID_MESSAGE_RATE = 10       # Berichten per seconde over de hele server -> lockdown
+RAID_DUPLICATE_USERS = 5     # Zoveel verschillende gebruikers met hetzelfde afgekeurde bericht -> lockdown
+RAID_DUPLICATE_MIN_LENGTH = 20  # Kortere berichten ("hoi", "gg") tellen niet als duplicaat
+RAID_JOIN_HALF_LIFE = 30     # Halfwaardetijd van de join teller (seconden)
+RAID_MESSAGE_HALF_LIFE = 10  # Halfwaardetijd van de berichten teller (seconden)
+RAID_WINDOW = 60             # Duplicaten worden binnen dit venster geteld (seconden)
+RAID_SKETCH_WIDTH = 4096     # Breedte van de count-min sketches
+RAID_SKETCH_DEPTH = 4
+LOCKDOWN_DURATION = 300      # Lockdown blijft zo lang na de laatste trigger actief (seconden)
+LOCKDOWN_SLOWMODE = 30       # Slowmode op alle tekstkanalen tijdens lockdown
+LOCKDOWN_QUARANTINE = 30     # Nieuwe leden tijdens een lockdown worden zo lang gemute (minuten)
+RATE_BUFFER_SIZE = 256  # Max aantal tijdstempels per kanaal (ring buffer)
+SWEEP_INTERVAL = 1      # Hoe vaak de sweeper de kanalen nakijkt (seconden)
+SLOWMODE_EDIT_CONCURRENCY = 5  # Channel edits van de sweeper die tegelijk lopen (bv. alle kanalen bij een lockdown)
+
+# Azure Content Safety
+AZURE_MAX_CONCURRENCY = int(os.getenv("AZURE_MAX_CONCURRENCY", 8))  # Max gelijktijdige requests
+AZURE_TIMEOUT = float(os.getenv("AZURE_TIMEOUT", 10))                # Timeout per request (seconden)
+
+# Verdict cache
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", 10000))  # Max aantal verdicts in geheugen
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", 3600))     # Hoe lang een verdict geldig blijft (seconden)
+VERDICT_PRUNE_INTERVAL = 600  # Hoe vaak verlopen verdicts uit de database verdwijnen (seconden)
+
+# Moderatie pipeline
+MODERATION_CONCURRENCY = int(os.getenv("MODERATION_CONCURRENCY", 64))  # Berichten tegelijk in behandeling (vult de batches)
+MODERATION_QUEUE_SIZE = int(os.getenv("MODERATION_QUEUE_SIZE", 500))  # Vol = overload, alleen lokale checks
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW_MS", 15)) / 1000         # Wachttijd om korte teksten samen te voegen
+BATCH_TEXT_MAX = 200      # Alleen teksten tot deze lengte worden samengevoegd
+AZURE_TEXT_LIMIT = 10000  # Max tekstlengte per Content Safety request
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.jpeg', '.gif', '.webp', '.bmp')
+ATTACHMENT_CONCURRENCY = 4  # Max aantal afbeeldingen per bericht die tegelijk gescand worden
+
+# Afbeeldingen voorbereiden
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))        # Threads die afbeeldingen decoderen
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 1024))   # Grotere afbeeldingen worden verkleind
+IMAGE_MIN_SIDE = 50       # Azure weigert kleinere afbeeldingen
+IMAGE_JPEG_QUALITY = 85
+ANIMATION_SAMPLE_FRAMES = 3  # Aantal frames dat van een GIF/WebP animatie gescand wordt
+
+# Lokale pre-filter
+BLOCKLIST_FILE = os.getenv("MODERATION_BLOCKLIST", "blocklist.txt")  # Eén woord per regel, optioneel "woord=severity"
+BLOCKLIST_SEVERITY = 2     # Standaard severity voor een woord op de blocklist
+SAFE_MESSAGE_MAX = 40      # Langere berichten gaan altijd naar Azure
+SAFE_WORDS = {
+    "ok", "oke", "oké", "okay", "k", "kk", "ja", "jaa", "ne", "nee", "neen", "yes", "no", "yep", "nope",
+    "hoi", "hey", "hallo", "hello", "hi", "yo", "dag", "doei", "bye", "gn", "gm", "goeiemorgen", "goedenacht",
+    "thanks", "thx", "ty", "bedankt", "merci", "dankjewel", "dankuwel", "dank", "je", "u", "np", "graag", "gedaan",
+    "lol", "lmao", "haha", "hahaha", "xd", "gg", "wp", "nice", "cool", "top", "idd", "inderdaad", "true", "klopt",
+    "goed", "prima", "sure", "zeker", "welkom", "welcome", "brb", "afk", "omg", "wow", "oei", "oeps", "sorry", "sry",
+}
+
+# Log sink
+LOG_BATCH_SIZE = 10           # Discord staat max 10 embeds per bericht toe
+LOG_FLUSH_INTERVAL = 2        # Max wachttijd voor een onvolledige batch verstuurd wordt (seconden)
+LOG_UPLOAD_LIMIT = 8 * 1024 * 1024  # Max grootte van alle bijlagen in één logbericht
+LOG_EMBED_CHAR_LIMIT = 6000   # Discord staat max 6000 tekens over alle embeds van één bericht toe
+LOG_SPOOL_FILE = os.getenv("LOG_SPOOL_FILE", "log_spool.jsonl")  # Nog niet verstuurde logs, overleven een herstart
+
+# Sancties bij spamgolven
+BULK_DELETE_WINDOW = 0.5     # Verwijderingen binnen dit venster worden per kanaal gebundeld (seconden)
+DM_CONCURRENCY = 5           # Max aantal DM's tegelijk
+DM_TIMEOUT = 3               # Zo lang wacht een ban/kick max op de DM (seconden)
+SANCTION_WORKERS = 2         # Workers voor bans/kicks
+SANCTION_DEDUP_WINDOW = 60   # Binnen dit venster wordt een gebruiker maar één keer bestraft (seconden)
+
+# Opslag
+DATABASE_FILE = os.getenv("MODERATION_DB", "moderation.db")
+STRIKE_WINDOW = 30 * 24 * 3600  # Overtredingen van de laatste 30 dagen tellen mee (seconden)
+STRIKE_ESCALATION = 3           # Vanaf zoveel eerdere overtredingen wordt de straf één niveau zwaarder
+MUTE_DURATION = int(os.getenv("MUTE_DURATION", 60))  # Duur van een automatische mute (minuten, 0 = onbeperkt)
+
+# Muted rol
+MUTED_ROLE_NAME = "Muted"
+PERMISSION_CONCURRENCY = 5  # Gelijktijdige permission edits bij het aanmaken (discord.py wacht zelf bij een 429)
 
 # Tracking
-message_counts = defaultdict(int)
-channel_status = defaultdict(bool)  # Bijhoudt per kanaal
+channel_windows = {}  # Per kanaal: tijdstempels van berichten binnen TIME_WINDOW
+slowmode_states = {}  # Per kanaal waar de bot slowmode beheert: ChannelSlowmode
+slowmode_edit_semaphore = asyncio.Semaphore(SLOWMODE_EDIT_CONCURRENCY)
 
 
 if GUILD_ID == 0:
@@ -50,7 +153,612 @@ content_safety_client = ContentSafetyClient(
     endpoint=os.getenv("Azure_Content_Safety_Endpoint"),
     credential=AzureKeyCredential(os.getenv("Azure_Content_Safety_Key"))
 )
-async def log_violation(log_channel, user, severity, content, channel=None, attachment=None):
+azure_semaphore = asyncio.Semaphore(AZURE_MAX_CONCURRENCY)  # Begrenst het aantal requests tegelijk
+image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")  # Decoderen buiten de event loop
+
+
+class VerdictCache:
+    # LRU cache met TTL: hash van de inhoud -> max severity
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0  # Niet in geheugen, wel in de database gevonden
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        severity, expires = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return severity
+
+    def peek(self, key):
+        # Zonder de LRU volgorde of de statistieken aan te passen
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key, severity):
+        self.entries[key] = (severity, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+def normalize_text(content):
+    # Normaliseer zodat kleine variaties (hoofdletters, spaties, unicode-varianten) gelijk worden
+    return " ".join(unicodedata.normalize("NFKC", content).casefold().split())
+
+def text_key(content):
+    return "t:" + hashlib.sha256(normalize_text(content).encode("utf-8")).hexdigest()
+
+def image_key(image_bytes):
+    return "i:" + hashlib.sha256(image_bytes).hexdigest()
+
+
+verdict_cache = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+inflight_verdicts = {}  # text_key -> future van de analyse die nog loopt
+
+
+class ModerationStore:
+    # SQLite in WAL mode op één eigen thread: overtredingen, actieve sancties en verdicts overleven een herstart.
+    # sqlite3 hergebruikt de gecompileerde statements zelf (statement cache), daarom vaste SQL strings.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS infractions (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            severity INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS infractions_user ON infractions (guild_id, user_id, created_at);
+
+        CREATE TABLE IF NOT EXISTS sanctions (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            expires_at REAL,
+            reason TEXT,
+            PRIMARY KEY (guild_id, user_id, kind)
+        );
+        CREATE INDEX IF NOT EXISTS sanctions_expiry ON sanctions (expires_at) WHERE expires_at IS NOT NULL;
+
+        CREATE TABLE IF NOT EXISTS verdicts (
+            key TEXT PRIMARY KEY,
+            severity INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _open(self):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self._write("DELETE FROM verdicts WHERE expires_at < ?", (time.time(),))
+
+    def _write(self, sql, params):
+        self.connection.execute(sql, params)
+        self.connection.commit()
+
+    def _fetchone(self, sql, params):
+        return self.connection.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        return self.connection.execute(sql, params).fetchall()
+
+    async def open(self):
+        await self.run(self._open)
+
+    async def close(self):
+        if self.connection is not None:
+            await self.run(self.connection.close)
+        self.executor.shutdown(wait=False)
+
+    async def add_infraction(self, guild_id, user_id, severity, content_type):
+        await self.run(self._write,
+            "INSERT INTO infractions (guild_id, user_id, severity, content_type, created_at) VALUES (?, ?, ?, ?, ?)",
+            (guild_id, user_id, severity, content_type, time.time()))
+
+    async def count_infractions(self, guild_id, user_id, since):
+        row = await self.run(self._fetchone,
+            "SELECT COUNT(*) FROM infractions WHERE guild_id = ? AND user_id = ? AND created_at >= ?",
+            (guild_id, user_id, since))
+        return row[0]
+
+    async def recent_infractions(self, guild_id, user_id, limit):
+        return await self.run(self._fetchall,
+            "SELECT severity, content_type, created_at FROM infractions "
+            "WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (guild_id, user_id, limit))
+
+    async def set_sanction(self, guild_id, user_id, kind, expires_at=None, reason=None):
+        await self.run(self._write,
+            "INSERT OR REPLACE INTO sanctions (guild_id, user_id, kind, expires_at, reason) VALUES (?, ?, ?, ?, ?)",
+            (guild_id, user_id, kind, expires_at, reason))
+
+    async def get_sanction_expiry(self, guild_id, user_id, kind):
+        row = await self.run(self._fetchone,
+            "SELECT expires_at FROM sanctions WHERE guild_id = ? AND user_id = ? AND kind = ?",
+            (guild_id, user_id, kind))
+        return row[0] if row else None
+
+    async def timed_sanctions(self):
+        return await self.run(self._fetchall,
+            "SELECT expires_at, guild_id, user_id, kind FROM sanctions WHERE expires_at IS NOT NULL ORDER BY expires_at",
+            ())
+
+    async def remove_sanction(self, guild_id, user_id, kind):
+        await self.run(self._write,
+            "DELETE FROM sanctions WHERE guild_id = ? AND user_id = ? AND kind = ?",
+            (guild_id, user_id, kind))
+
+    async def get_verdict(self, key):
+        row = await self.run(self._fetchone,
+            "SELECT severity FROM verdicts WHERE key = ? AND expires_at >= ?",
+            (key, time.time()))
+        return row[0] if row else None
+
+    async def set_verdict(self, key, severity, ttl):
+        await self.run(self._write,
+            "INSERT OR REPLACE INTO verdicts (key, severity, expires_at) VALUES (?, ?, ?)",
+            (key, severity, time.time() + ttl))
+
+    async def prune_verdicts(self):
+        await self.run(self._write, "DELETE FROM verdicts WHERE expires_at < ?", (time.time(),))
+
+
+store = ModerationStore(DATABASE_FILE)
+
+
+class SanctionScheduler:
+    # Eén task met een heap van vervaltijden i.p.v. een slapende task per mute/ban: één wakeup per deadline
+
+    def __init__(self):
+        self.heap = []  # (expires_at, guild_id, user_id, kind)
+        self.changed = asyncio.Event()
+
+    def schedule(self, expires_at, guild_id, user_id, kind):
+        heapq.heappush(self.heap, (expires_at, guild_id, user_id, kind))
+        if self.heap[0][0] == expires_at:
+            self.changed.set()
+
+    async def rehydrate(self):
+        for row in await store.timed_sanctions():
+            heapq.heappush(self.heap, tuple(row))
+        self.changed.set()
+
+    async def run(self):
+        await bot.wait_until_ready()
+        while True:
+            delay = self.heap[0][0] - time.time() if self.heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.changed.clear()
+                continue
+
+            expires_at, guild_id, user_id, kind = heapq.heappop(self.heap)
+            try:
+                await self.expire(expires_at, guild_id, user_id, kind)
+            except Exception:
+                # De task mag nooit stoppen, anders verloopt geen enkele mute/ban meer tot een herstart
+                log.exception("sanction_scheduler_error", kind=kind, user=user_id)
+
+    async def expire(self, expires_at, guild_id, user_id, kind):
+        # Verouderde entries (al opgeheven of verlengd) gewoon overslaan
+        if await store.get_sanction_expiry(guild_id, user_id, kind) != expires_at:
+            return
+        try:
+            await expire_sanction(guild_id, user_id, kind)
+        except discord.HTTPException as e:
+            log.error("sanction_expire_failed", kind=kind, user=user_id, error=e)
+        await store.remove_sanction(guild_id, user_id, kind)
+
+
+sanction_scheduler = SanctionScheduler()
+
+async def add_sanction(guild_id, user_id, kind, minutes=0, reason=None):
+    
+    expires_at = time.time() + minutes * 60 if minutes > 0 else None
+    await store.set_sanction(guild_id, user_id, kind, expires_at, reason)
+    if expires_at is not None:
+        sanction_scheduler.schedule(expires_at, guild_id, user_id, kind)
+
+async def expire_sanction(guild_id, user_id, kind):
+    
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return
+
+    if kind == "mute":
+        member = guild.get_member(user_id)
+        muted_role = find_muted_role(guild)
+        if member is None or muted_role is None or muted_role not in member.roles:
+            return
+        await member.remove_roles(muted_role, reason="Mute verlopen")
+        description = f"{member.mention} is automatisch geunmute"
+        title = "Unmute Log"
+    else:
+        try:
+            await guild.unban(discord.Object(id=user_id), reason="Ban verlopen")
+        except discord.NotFound:
+            return
+        description = f"<@{user_id}> is automatisch geunbanned"
+        title = "Unban Log"
+
+    if LOG_CHANNEL_MODERATOR_ID:
+        log_embed = discord.Embed(
+            title=title,
+            description=description,
+            color=discord.Color.green(),
+            timestamp=datetime.datetime.now(datetime.timezone.utc)
+        )
+        log_embed.add_field(name="Reden", value="Tijdelijke sanctie verlopen", inline=False)
+        log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
+
+def format_duration(minutes):
+    return f"{minutes} minuten" if minutes > 0 else "Onbeperkt"
+
+async def cached_verdict(key):
+    # Eerst geheugen, dan de database (verdicts van voor een herstart)
+    severity = verdict_cache.get(key)
+    if severity is None:
+        severity = await store.get_verdict(key)
+        if severity is not None:
+            # Geen echte miss: er is geen nieuwe analyse nodig
+            verdict_cache.misses -= 1
+            verdict_cache.db_hits += 1
+            verdict_cache.set(key, severity)
+    return severity
+
+def remember_verdict(key, severity):
+    verdict_cache.set(key, severity)
+    spawn(store.set_verdict(key, severity, VERDICT_CACHE_TTL))
+background_tasks = set()  # Referenties naar losse tasks zodat ze niet door de GC worden opgeruimd
+
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+class TextBatcher:
+    # Voegt korte teksten samen tot één Azure request: wat binnenkomt terwijl een request loopt gaat samen in de volgende
+
+    def __init__(self, window, limit):
+        self.window = window
+        self.limit = limit
+        self.pending = []  # (tekst, future)
+        self.keys = {}     # text_key -> future, dezelfde tekst maar één keer per batch
+        self.size = 0
+        self.flush_handle = None
+        self.running = 0  # Batches waarvan het Azure request nog loopt
+        self.requests = 0
+        self.texts = 0
+
+    def submit(self, content):
+        loop = asyncio.get_running_loop()
+        key = text_key(content)
+        if key in self.keys:
+            return self.keys[key]
+        if self.pending and self.size + len(content) + 1 > self.limit:
+            self.flush()
+
+        future = loop.create_future()
+        self.pending.append((content, future))
+        self.keys[key] = future
+        self.size += len(content) + 1
+        if self.running == 0:
+            # Niets onderweg: meteen versturen, teksten die ondertussen binnenkomen vormen de volgende batch
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending, self.size = self.pending, [], 0
+        self.keys = {}
+        if batch:
+            self.running += 1
+            spawn(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        self.texts += len(batch)
+        try:
+            severities = await self.severities([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.running -= 1
+
+        for (_, future), severity in zip(batch, severities):
+            if not future.done():
+                future.set_result(severity)
+
+    async def severities(self, texts):
+        self.requests += 1
+        combined = await request_text_severity("\n".join(texts))
+        if combined < 2 or len(texts) == 1:
+            # Samen onschuldig -> elk bericht apart ook
+            return [combined] * len(texts)
+        # Minstens één bericht is fout: de helften apart nakijken tot elk verdict bij het juiste bericht hoort
+        middle = len(texts) // 2
+        first, second = await asyncio.gather(self.severities(texts[:middle]), self.severities(texts[middle:]))
+        return first + second
+
+
+class AhoCorasick:
+    # Automaat die alle blocklist-woorden in één enkele pass over de tekst zoekt
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # Per state: (lengte, severity) van de woorden die hier eindigen
+        for term, severity in terms.items():
+            self.add(term, severity)
+        self.build()
+
+    def add(self, term, severity):
+        state = 0
+        for char in term:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(term), severity))
+
+    def build(self):
+        # Breadth-first de fail links zetten (states op diepte 1 vallen terug op de root)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def max_severity(self, text):
+        # Enkel hele woorden tellen, zodat "class" niet matcht op "ass"
+        state = 0
+        severity = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, term_severity in self.output[state]:
+                start = index - length + 1
+                before_ok = start == 0 or not text[start - 1].isalnum()
+                after_ok = index + 1 == len(text) or not text[index + 1].isalnum()
+                if before_ok and after_ok:
+                    severity = max(severity, term_severity)
+        return severity
+
+
+def load_blocklist(path):
+    
+    terms = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                term, _, severity = line.partition("=")
+                term = normalize_text(term)
+                if term:
+                    terms[term] = int(severity) if severity.strip().isdigit() else BLOCKLIST_SEVERITY
+    except FileNotFoundError:
+        log.info("blocklist_missing", path=path)
+    return terms
+
+
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:\d+>")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+blocklist = AhoCorasick(load_blocklist(BLOCKLIST_FILE))
+prefilter_stats = {"allowed": 0, "blocked": 0, "escalated": 0}
+
+def local_verdict(content):
+    # Geeft een severity terug als het lokaal beslist kan worden, anders None (-> Azure)
+    normalized = normalize_text(CUSTOM_EMOJI_PATTERN.sub(" ", content))
+
+    severity = blocklist.max_severity(normalized)
+    if severity:
+        prefilter_stats["blocked"] += 1
+        return severity
+
+    if len(normalized) <= SAFE_MESSAGE_MAX:
+        words = WORD_PATTERN.findall(normalized)
+        # Alleen emoji/leestekens of enkel onschuldige woorden
+        if all(word in SAFE_WORDS for word in words):
+            prefilter_stats["allowed"] += 1
+            return 0
+
+    prefilter_stats["escalated"] += 1
+    return None
+
+
+text_batcher = TextBatcher(BATCH_WINDOW, AZURE_TEXT_LIMIT)
+moderation_queue = asyncio.Queue(maxsize=MODERATION_QUEUE_SIZE)
+moderation_slots = asyncio.Semaphore(MODERATION_CONCURRENCY)  # Vol -> de queue loopt vol -> overload pad
+pipeline_stats = {
+    "enqueued": 0,
+    "processed": 0,
+    "overload": 0,
+    "max_depth": 0,
+    "wait_total": 0.0,
+}
+
+class LogSink:
+    # Verzamelt log embeds per kanaal en verstuurt ze gebundeld, zodat moderatie nooit op Discord moet wachten
+
+    def __init__(self, spool_path):
+        self.spool_path = spool_path
+        self.pending = defaultdict(deque)  # channel_id -> [{"embed": dict, "file_name": str, "file": bytes}]
+        self.wakeup = asyncio.Event()
+        self.dirty = False
+        self.file_counter = 0
+        self.embeds_sent = 0
+        self.messages_sent = 0
+
+    def send(self, channel_id, embed, file_name=None, file_bytes=None):
+        entry = {"embed": embed.to_dict()}
+        if file_bytes is not None and len(file_bytes) <= LOG_UPLOAD_LIMIT:
+            # Unieke naam, want meerdere bijlagen komen samen in één bericht
+            self.file_counter += 1
+            entry["file_name"] = f"{self.file_counter}_{file_name}"
+            entry["file"] = file_bytes
+            entry["embed"]["image"] = {"url": f"attachment://{entry['file_name']}"}
+        self.pending[channel_id].append(entry)
+        self.dirty = True
+        if len(self.pending[channel_id]) >= LOG_BATCH_SIZE:
+            self.wakeup.set()
+
+    def pending_count(self):
+        return sum(len(entries) for entries in self.pending.values())
+
+    def load(self):
+        # Logs die bij een vorige run niet meer verstuurd raakten terug inladen (zonder bijlagen)
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    record["embed"].pop("image", None)
+                    self.pending[record["channel_id"]].append({"embed": record["embed"]})
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, KeyError) as e:
+            log.error("log_spool_corrupt", error=e)
+
+    def write_spool(self, records):
+        temp_path = self.spool_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.spool_path)
+
+    async def persist(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        records = [
+            {"channel_id": channel_id, "embed": entry["embed"]}
+            for channel_id, entries in self.pending.items()
+            for entry in entries
+        ]
+        await asyncio.to_thread(self.write_spool, records)
+
+    def next_batch(self, entries, limit=LOG_BATCH_SIZE):
+        batch = []
+        upload_size = 0
+        characters = 0
+        for entry in entries:
+            size = len(entry.get("file", b""))
+            length = len(discord.Embed.from_dict(entry["embed"]))
+            if len(batch) == limit or (batch and (upload_size + size > LOG_UPLOAD_LIMIT or
+                                                  characters + length > LOG_EMBED_CHAR_LIMIT)):
+                break
+            batch.append(entry)
+            upload_size += size
+            characters += length
+        return batch
+
+    async def flush_channel(self, channel_id):
+        entries = self.pending[channel_id]
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            # Kanaal (nog) niet in de cache: entries blijven staan voor de volgende flush
+            log.warning("log_channel_missing", channel=channel_id, pending=len(entries))
+            return
+
+        singles = 0  # zoveel entries na een geweigerde batch één per bericht versturen
+        while entries:
+            batch = self.next_batch(entries, 1 if singles else LOG_BATCH_SIZE)
+            embeds = [discord.Embed.from_dict(entry["embed"]) for entry in batch]
+            files = [discord.File(BytesIO(entry["file"]), filename=entry["file_name"]) for entry in batch if "file" in entry]
+            try:
+                # discord.py wacht zelf bij een 429, de batch blijft ondertussen in de spool staan
+                await channel.send(embeds=embeds, files=files)
+            except (discord.Forbidden, discord.NotFound) as e:
+                log.error("log_send_forbidden", channel=channel_id, error=e)
+            except discord.HTTPException as e:
+                if e.status == 429 or e.status >= 500:
+                    log.warning("log_send_retry", channel=channel_id, error=e)
+                    return
+                if len(batch) > 1:
+                    # Discord weigert de batch: per embed opnieuw proberen zodat enkel de foute embed wegvalt
+                    log.warning("log_batch_rejected", channel=channel_id, size=len(batch), error=e)
+                    singles = len(batch)
+                    continue
+                log.error("log_send_rejected", channel=channel_id, error=e)
+            else:
+                self.embeds_sent += len(batch)
+                self.messages_sent += 1
+            singles = max(0, singles - 1)
+            for _ in batch:
+                entries.popleft()
+            self.dirty = True
+
+        del self.pending[channel_id]
+
+    async def run(self):
+        # setup_hook loopt voor de gateway verbonden is: zonder cache zijn de log kanalen nog onbekend
+        await bot.wait_until_ready()
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), LOG_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            await self.persist()
+            for channel_id in list(self.pending):
+                await self.flush_channel(channel_id)
+            await self.persist()
+
+
+log_sink = LogSink(LOG_SPOOL_FILE)
+
+def log_violation(user, severity, content, channel=None, attachment=None, image_bytes=None):
    
     embed = discord.Embed(
         title="🚨 Content Violation",
@@ -65,187 +773,478 @@ async def log_violation(log_channel, user, severity, content, channel=None, atta
     
     embed.add_field(name="Content", value=f"```{content[:1000]}```", inline=False)
     
-    if attachment:
-        try:
-            
-            file = discord.File(
-                BytesIO(await attachment.read()),
-                filename=attachment.filename
-            )
-            embed.set_image(url=f"attachment://{attachment.filename}")
-            await log_channel.send(embed=embed, file=file)
-            return
-        except Exception as e:
-            print(f"[ERROR] Failed to process image: {e}")
-            embed.add_field(name="Image Error", value="Could not process image", inline=False)
+    if attachment and image_bytes is not None:
+        log_sink.send(LOG_CHANNEL_ID, embed, attachment.filename, image_bytes)
+    else:
+        log_sink.send(LOG_CHANNEL_ID, embed)
+
+async def request_text_severity(content):
     
-    await log_channel.send(embed=embed)
+    request = AnalyzeTextOptions(text=content)
+    async with azure_semaphore:
+        response = await asyncio.wait_for(content_safety_client.analyze_text(request), AZURE_TIMEOUT)
+    return max(item.severity for item in response.categories_analysis)
 
 async def analyze_text(content):
    
-    request = AnalyzeTextOptions(text=content)
-    response = content_safety_client.analyze_text(request)
-    return max(item.severity for item in response.categories_analysis)
+    severity = local_verdict(content)
+    if severity is not None:
+        return severity
 
-async def analyze_image(image_bytes):
+    key = text_key(content)
+    pending = inflight_verdicts.get(key)
+    if pending is not None:
+        # Dezelfde tekst wordt al geanalyseerd: op dat resultaat wachten i.p.v. Azure opnieuw te vragen
+        return await asyncio.shield(pending)
+
+    pending = inflight_verdicts[key] = asyncio.get_running_loop().create_future()
+    try:
+        severity = await cached_verdict(key)
+        if severity is None:
+            if len(content) <= BATCH_TEXT_MAX:
+                severity = await text_batcher.submit(content)
+            else:
+                severity = await request_text_severity(content)
+            remember_verdict(key, severity)
+    except asyncio.CancelledError:
+        pending.cancel()
+        raise
+    except Exception as e:
+        pending.set_exception(e)
+        pending.exception()  # geen "never retrieved" waarschuwing als niemand meewachtte
+        raise
+    else:
+        pending.set_result(severity)
+    finally:
+        del inflight_verdicts[key]
+    return severity
+
+def encode_frame(frame):
+    
+    # Transparantie op een witte achtergrond zetten, JPEG kent geen alpha
+    frame = frame.convert("RGBA")
+    background = Image.new("RGB", frame.size, (255, 255, 255))
+    background.paste(frame, mask=frame.getchannel("A"))
+
+    background.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    if min(background.size) < IMAGE_MIN_SIDE:
+        # Opschalen zonder dat de lange zijde boven IMAGE_MAX_SIDE komt, wat dan nog te smal is opvullen met wit
+        scale = min(IMAGE_MIN_SIDE / min(background.size), IMAGE_MAX_SIDE / max(background.size))
+        if scale > 1:
+            background = background.resize((max(1, round(background.width * scale)), max(1, round(background.height * scale))))
+        if min(background.size) < IMAGE_MIN_SIDE:
+            canvas = Image.new("RGB", (max(background.width, IMAGE_MIN_SIDE), max(background.height, IMAGE_MIN_SIDE)), (255, 255, 255))
+            canvas.paste(background, (0, 0))
+            background = canvas
+
+    buffer = BytesIO()
+    background.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+def prepare_image(image_bytes):
+    # Draait in image_pool: decoderen, verkleinen en als compacte JPEG hercoderen (animaties -> enkele frames)
+    with Image.open(BytesIO(image_bytes)) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        if frame_count == 1:
+            # JPEG direct op lagere resolutie decoderen
+            image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+            return [encode_frame(image)]
+
+        samples = min(ANIMATION_SAMPLE_FRAMES, frame_count)
+        indices = sorted({round(i * (frame_count - 1) / max(samples - 1, 1)) for i in range(samples)})
+        frames = []
+        for index in indices:
+            image.seek(index)
+            frames.append(encode_frame(image))
+        return frames
+
+async def request_image_severity(image_bytes):
     
     request = AnalyzeImageOptions(image=ImageData(content=image_bytes))
-    response = content_safety_client.analyze_image(request)
+    async with azure_semaphore:
+        response = await asyncio.wait_for(content_safety_client.analyze_image(request), AZURE_TIMEOUT)
     return max(item.severity for item in response.categories_analysis)
 
-async def take_action(message, max_severity, content_type="text"):
-    reason = f"Inappropriate {content_type} (severity {max_severity})"
+async def analyze_image(image_bytes):
     
-    if max_severity >= 4:
-       
-        try:
-            
+    key = image_key(image_bytes)
+    cached = await cached_verdict(key)
+    if cached is not None:
+        return cached
+
+    try:
+        frames = await asyncio.get_running_loop().run_in_executor(image_pool, prepare_image, image_bytes)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        # Kan niet gedecodeerd worden: origineel doorsturen en Azure laten beslissen
+        log.warning("image_prepare_failed", error=e)
+        frames = [image_bytes]
+
+    severity = max(await asyncio.gather(*(request_image_severity(frame) for frame in frames)))
+    remember_verdict(key, severity)
+    return severity
+
+muted_roles = {}       # guild_id -> Muted rol, zodat we niet telkens guild.roles moeten doorzoeken
+muted_role_locks = {}  # guild_id -> lock, zodat de rol maar één keer aangemaakt wordt
+
+def find_muted_role(guild):
+    
+    role = muted_roles.get(guild.id)
+    if role is None:
+        role = discord.utils.get(guild.roles, name=MUTED_ROLE_NAME)
+        if role is not None:
+            muted_roles[guild.id] = role
+    return role
+
+async def apply_muted_overwrites(role, channels):
+    # Permissies voor alle kanalen tegelijk zetten, begrensd zodat we niet in de rate limit knallen
+    semaphore = asyncio.Semaphore(PERMISSION_CONCURRENCY)
+
+    async def overwrite(channel):
+        async with semaphore:
+            try:
+                await channel.set_permissions(role, send_messages=False, speak=False)
+            except discord.HTTPException as e:
+                log.error("muted_overwrite_failed", channel=channel.id, error=e)
+
+    await asyncio.gather(*(overwrite(channel) for channel in channels))
+
+async def get_muted_role(guild):
+    # Zoek of maak de Muted rol (raises discord.Forbidden als de bot geen rollen mag maken)
+    role = find_muted_role(guild)
+    if role is not None:
+        return role
+
+    lock = muted_role_locks.setdefault(guild.id, asyncio.Lock())
+    async with lock:
+        role = find_muted_role(guild)
+        if role is None:
+            role = await guild.create_role(name=MUTED_ROLE_NAME, reason="Muted rol voor moderatie")
+            await apply_muted_overwrites(role, guild.channels)
+            muted_roles[guild.id] = role
+    return role
+
+class SanctionExecutor:
+    # Bundelt het opruimen bij spamgolven: verwijderingen per kanaal via bulk delete, DM's zonder te wachten,
+    # bans/kicks via een queue met een paar workers (discord.py wacht zelf bij een 429)
+
+    def __init__(self):
+        self.deletions = defaultdict(dict)  # channel_id -> {message_id: message}
+        self.delete_handle = None
+        self.dm_semaphore = asyncio.Semaphore(DM_CONCURRENCY)
+        self.removals = asyncio.Queue()
+        self.claimed = {}  # (guild_id, user_id) -> (tijdstip, severity), zodat één gebruiker maar één keer bestraft wordt
+        self.messages_deleted = 0
+        self.delete_calls = 0
+        self.removals_done = 0
+
+    def claim(self, guild_id, user_id, severity):
+        # Binnen het venster enkel een zwaardere straf doorlaten (bv. eerst mute, daarna toch een ban)
+        now = time.monotonic()
+        key = (guild_id, user_id)
+        claimed_at, claimed_severity = self.claimed.get(key, (float("-inf"), 0))
+        if now - claimed_at < SANCTION_DEDUP_WINDOW and severity <= claimed_severity:
+            return False
+        if len(self.claimed) > 10000:
+            self.claimed = {k: v for k, v in self.claimed.items() if now - v[0] < SANCTION_DEDUP_WINDOW}
+        self.claimed[key] = (now, severity)
+        return True
+
+    def delete(self, message):
+        self.deletions[message.channel.id][message.id] = message
+        if self.delete_handle is None:
+            self.delete_handle = asyncio.get_running_loop().call_later(BULK_DELETE_WINDOW, self.flush_deletions)
+
+    def flush_deletions(self):
+        self.delete_handle = None
+        pending, self.deletions = self.deletions, defaultdict(dict)
+        for messages in pending.values():
+            spawn(self.delete_in_channel(list(messages.values())))
+
+    async def delete_in_channel(self, messages):
+        channel = messages[0].channel
+        # Bulk delete kan max 100 berichten per keer
+        for i in range(0, len(messages), 100):
+            chunk = messages[i:i + 100]
             try:
-                embed = discord.Embed(
-                    title=f"Je bent verbannen van {message.guild.name}",
-                    color=discord.Color.red()
-                )
-                embed.add_field(name="Reden", value=reason, inline=False)
-                embed.add_field(
-                    name="Unban aanvragen", 
-                    value="Neem contact op met een moderator en vermeld @yassin1255 om een unban aan te vragen.",
-                    inline=False
-                )
-                embed.set_footer(text=f"Verbannen door {bot.user.name}")
-                await message.author.send(embed=embed)
-            except discord.Forbidden:
+                await channel.delete_messages(chunk)
+                self.messages_deleted += len(chunk)
+                self.delete_calls += 1
+            except discord.NotFound:
                 pass
+            except discord.HTTPException as e:
+                log.error("bulk_delete_failed", channel=channel.id, count=len(chunk), error=e)
 
-            
-            await message.author.ban(reason=reason)
-            await message.channel.send(f"{message.author.mention} is verbannen wegens ernstig ongepaste inhoud.", delete_after=10)
-            
-        except discord.Forbidden:
-            await message.channel.send("Geen ban permissies.", delete_after=5)
-    
-    elif max_severity >= 3:
-      
-        try:
-            
+    def dm(self, user, embed):
+        return spawn(self.send_dm(user, embed))
+
+    async def send_dm(self, user, embed):
+        async with self.dm_semaphore:
             try:
-                
-                embed = discord.Embed(
-                    title=f"Je bent gekicked van {message.guild.name}",
-                    color=discord.Color.orange()
-                )
-                embed.add_field(name="Reden", value=reason, inline=False)
-                embed.add_field(
-                    name="Je kunt weer joinen", 
-                    value=f"Neem contact op met een moderator en vermeld @yassin1255 om een invite link aan te vragen."
-                         f"Let op: deze link kan maar 1 keer gebruikt worden!",
-                    inline=False
-                )
-                embed.set_footer(text=f"Gekicked door {bot.user.name}")
-                await message.author.send(embed=embed)
-            except discord.Forbidden:
+                await user.send(embed=embed)
+            except discord.HTTPException:
                 pass
 
-           
-            await message.author.kick(reason=reason)
-            await message.channel.send(f"{message.author.mention} is gekicked wegens ongepaste inhoud.", delete_after=10)
-            
+    def remove(self, message, reason, dm_task, kick=False):
+        self.removals.put_nowait((message, reason, dm_task, kick))
+
+    async def run(self):
+        while True:
+            message, reason, dm_task, kick = await self.removals.get()
+            try:
+                await self.execute(message, reason, dm_task, kick)
+            except Exception:
+                # Een worker mag nooit stoppen, anders blijven bans/kicks stil in de queue hangen
+                log.exception("removal_worker_error", user=message.author.id, kick=kick)
+            finally:
+                self.removals.task_done()
+
+    async def execute(self, message, reason, dm_task, kick):
+        # De DM moet aankomen voor de gebruiker de server uit is, maar er nooit lang op wachten
+        await asyncio.wait({dm_task}, timeout=DM_TIMEOUT)
+        try:
+            if kick:
+                await message.guild.kick(message.author, reason=reason)
+            else:
+                await message.guild.ban(message.author, reason=reason)
         except discord.Forbidden:
-            await message.channel.send("Geen kick permissies.", delete_after=5)
+            await self.announce(message.channel, f"Geen {'kick' if kick else 'ban'} permissies.", 5)
+            return
+        except discord.HTTPException as e:
+            log.error("removal_failed", user=message.author.id, kick=kick, error=e)
+            return
+
+        self.removals_done += 1
+        if kick:
+            await self.announce(message.channel, f"{message.author.mention} is gekicked wegens ongepaste inhoud.", 10)
+        else:
+            spawn(add_sanction(message.guild.id, message.author.id, "ban", reason=reason))
+            await self.announce(message.channel, f"{message.author.mention} is verbannen wegens ernstig ongepaste inhoud.", 10)
+
+    async def announce(self, channel, text, delete_after):
+        try:
+            await channel.send(text, delete_after=delete_after)
+        except discord.HTTPException as e:
+            log.warning("removal_notice_failed", channel=channel.id, error=e)
+
+
+sanction_executor = SanctionExecutor()
+
+async def take_action(message, max_severity, content_type="text"):
+    reason = f"Inappropriate {content_type} (severity {max_severity})"
+
+    # Bericht altijd opruimen (gebundeld per kanaal), de straf maar één keer per gebruiker en severity
+    sanction_executor.delete(message)
+    guild_id, user_id = message.guild.id, message.author.id
+    if not sanction_executor.claim(guild_id, user_id, max_severity):
+        return
+
+    # Herhaalde overtreders krijgen een zwaardere straf (index lookup op guild, user, tijd)
+    strikes = await store.count_infractions(guild_id, user_id, time.time() - STRIKE_WINDOW)
+    spawn(store.add_infraction(guild_id, user_id, max_severity, content_type))
+    if strikes >= STRIKE_ESCALATION and max_severity < 4:
+        max_severity += 1
+        reason += f", {strikes} eerdere overtredingen"
+    
+    if max_severity >= 4:
+       
+        embed = discord.Embed(
+            title=f"Je bent verbannen van {message.guild.name}",
+            color=discord.Color.red()
+        )
+        embed.add_field(name="Reden", value=reason, inline=False)
+        embed.add_field(
+            name="Unban aanvragen", 
+            value="Neem contact op met een moderator en vermeld @yassin1255 om een unban aan te vragen.",
+            inline=False
+        )
+        embed.set_footer(text=f"Verbannen door {bot.user.name}")
+        sanction_executor.remove(message, reason, sanction_executor.dm(message.author, embed))
+    
+    elif max_severity >= 3:
+      
+        embed = discord.Embed(
+            title=f"Je bent gekicked van {message.guild.name}",
+            color=discord.Color.orange()
+        )
+        embed.add_field(name="Reden", value=reason, inline=False)
+        embed.add_field(
+            name="Je kunt weer joinen", 
+            value=f"Neem contact op met een moderator en vermeld @yassin1255 om een invite link aan te vragen."
+                 f"Let op: deze link kan maar 1 keer gebruikt worden!",
+            inline=False
+        )
+        embed.set_footer(text=f"Gekicked door {bot.user.name}")
+        sanction_executor.remove(message, reason, sanction_executor.dm(message.author, embed), kick=True)
     
     elif max_severity >= 2:
       
-        muted_role = discord.utils.get(message.guild.roles, name="Muted")
-        if not muted_role:
-            try:
-                muted_role = await message.guild.create_role(name="Muted")
-                for channel in message.guild.channels:
-                    await channel.set_permissions(muted_role, send_messages=False)
-            except discord.Forbidden:
-                await message.channel.send("Kan Muted rol niet maken.", delete_after=10)
-                return
+        try:
+            muted_role = await get_muted_role(message.guild)
+        except discord.Forbidden:
+            await message.channel.send("Kan Muted rol niet maken.", delete_after=10)
+            return
         
         try:
-         
-            try:
-                embed = discord.Embed(
-                    title=f"Je bent gemute in {message.guild.name}",
-                    description="Je kunt niet meer praten in tekst- en spraakkanalen.",
-                    color=discord.Color.orange()
-                )
-                embed.add_field(name="Reden", value=reason, inline=False)
-                embed.add_field(
-                    name="Unmute aanvragen", 
-                    value="Neem contact op met @yassin1255 om een unmute aan te vragen.",
-                    inline=False
-                )
-                embed.set_footer(text=f"Gemute door {bot.user.name}")
-                await message.author.send(embed=embed)
-            except discord.Forbidden:
-                pass
-
-       
             await message.author.add_roles(muted_role)
+            spawn(add_sanction(guild_id, user_id, "mute", MUTE_DURATION, reason))
             await message.channel.send(f"{message.author.mention} is gemute voor ongepaste inhoud.", delete_after=15)
-            
         except discord.Forbidden:
             await message.channel.send("Geen mute permissies.", delete_after=15)
+            return
+
+        # Na de mute, de gebruiker blijft in de server dus de DM kan wachten
+        embed = discord.Embed(
+            title=f"Je bent gemute in {message.guild.name}",
+            description="Je kunt niet meer praten in tekst- en spraakkanalen.",
+            color=discord.Color.orange()
+        )
+        embed.add_field(name="Reden", value=reason, inline=False)
+        embed.add_field(name="Duur", value=format_duration(MUTE_DURATION), inline=False)
+        embed.add_field(
+            name="Unmute aanvragen", 
+            value="Neem contact op met @yassin1255 om een unmute aan te vragen.",
+            inline=False
+        )
+        embed.set_footer(text=f"Gemute door {bot.user.name}")
+        sanction_executor.dm(message.author, embed)
     
-    await message.delete()
-    print(f"[ACTION] {content_type.capitalize()} verwijderd met severity {max_severity}")
+    log.info("action", user=user_id, channel=message.channel.id, type=content_type, severity=max_severity)
 
-async def handle_moderation(message):
+def should_moderate(message):
     
     if message.author == bot.user:
-        return
+        return False
     
     # Skip commands and DMs
     if message.content.startswith(bot.command_prefix) or not message.guild:
-        return await bot.process_commands(message)
+        return False
     
     # Skip logkanaal
     if message.channel.id == LOG_CHANNEL_ID:
-        return await bot.process_commands(message)
+        return False
+    
+    return True
+
+async def enqueue_moderation(message):
+    
+    if not should_moderate(message):
+        return
+
+    try:
+        moderation_queue.put_nowait((message, time.monotonic()))
+    except asyncio.QueueFull:
+        # Overload: Azure overslaan en alleen goedkope lokale checks doen
+        pipeline_stats["overload"] += 1
+        await handle_overload(message)
+        return
+
+    pipeline_stats["enqueued"] += 1
+    pipeline_stats["max_depth"] = max(pipeline_stats["max_depth"], moderation_queue.qsize())
+
+async def handle_overload(message):
+    
+    # Alleen lokale checks en reeds gekende verdicts, geen nieuwe Azure requests
+    if not message.content:
+        return
+    severity = local_verdict(message.content)
+    if severity is None:
+        severity = verdict_cache.get(text_key(message.content))
+    if severity is not None and severity >= 2:
+        log_violation(message.author, severity, message.content, message.channel)
+        await take_action(message, severity)
+
+async def moderation_worker():
+    # Wacht niet op elk bericht: tot MODERATION_CONCURRENCY berichten tegelijk, zodat de batcher echt kan bundelen
+    while True:
+        await moderation_slots.acquire()
+        message, queued_at = await moderation_queue.get()
+        pipeline_stats["wait_total"] += time.monotonic() - queued_at
+        spawn(moderate_queued(message))
+
+async def moderate_queued(message):
+    try:
+        await handle_moderation(message)
+    finally:
+        pipeline_stats["processed"] += 1
+        moderation_queue.task_done()
+        moderation_slots.release()
+
+async def scan_attachment(attachment, semaphore):
+    
+    # Een fout op één afbeelding (Azure 400, timeout, download) telt als severity 0, de rest van het bericht gaat door
+    async with semaphore:
+        try:
+            image_bytes = await attachment.read()
+            image_severity = await analyze_image(image_bytes)
+        except (HttpResponseError, asyncio.TimeoutError, discord.HTTPException) as e:
+            log.warning("image_scan_failed", attachment=attachment.id, error=repr(e))
+            return attachment, None, 0
+        except Exception:
+            log.exception("image_scan_failed", attachment=attachment.id)
+            return attachment, None, 0
+        log.debug("image_analyzed", message=attachment.id, size=len(image_bytes), severity=image_severity)
+    return attachment, image_bytes, image_severity
+
+async def scan_attachments(attachments):
+    # Alle afbeeldingen tegelijk scannen (begrensd) en stoppen zodra er één ban-waardig is
+    semaphore = asyncio.Semaphore(ATTACHMENT_CONCURRENCY)
+    tasks = [asyncio.create_task(scan_attachment(attachment, semaphore)) for attachment in attachments]
+    results = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            results.append(result)
+            if result[2] >= 4:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results
+
+async def handle_moderation(message):
     
     try:
-        log_channel = bot.get_channel(LOG_CHANNEL_ID)
         max_severity = 0
+        text_severity = 0
+
+        images = [a for a in message.attachments if a.filename.lower().endswith(IMAGE_EXTENSIONS)]
+        image_scan = asyncio.create_task(scan_attachments(images)) if images else None
+
+        try:
+            if message.content:
+                text_severity = await analyze_text(message.content)
+                log.debug("text_analyzed", message=message.id, length=len(message.content), severity=text_severity)
+                max_severity = max(max_severity, text_severity)
+
+            image_results = await image_scan if image_scan else []
+        finally:
+            if image_scan:
+                image_scan.cancel()
 
-        if message.content:
-            print(f"[DEBUG] Analyzing text: {message.content}")
-            text_severity = await analyze_text(message.content)
-            print(f"[DEBUG] Text severity: {text_severity}")
-            max_severity = max(max_severity, text_severity)
-
-        for attachment in message.attachments:
-            if any(attachment.filename.lower().endswith(ext) for ext in ['.jpg', '.png', '.jpeg']):
-                print(f"[DEBUG] Analyzing image: {attachment.filename}")
-                image_bytes = await attachment.read()
-                image_severity = await analyze_image(image_bytes)
-                print(f"[DEBUG] Image severity: {image_severity}")
-                max_severity = max(max_severity, image_severity)
-                
-                if max_severity >= 2:
-                     await log_violation(log_channel, message.author, image_severity,
-                    f"Image: {attachment.filename} ({attachment.url})", 
-                    message.channel, attachment)
+        for attachment, image_bytes, image_severity in image_results:
+            max_severity = max(max_severity, image_severity)
+            if image_severity >= 2:
+                # Zelfde bytes hergebruiken, geen tweede download voor de log
+                log_violation(message.author, image_severity,
+                    f"Image: {attachment.filename} ({attachment.url})",
+                    message.channel, attachment, image_bytes)
 
         if max_severity >= 2:
-            if message.content and not message.attachments:
-                await log_violation(log_channel, message.author, max_severity,
+            if text_severity >= 2:
+                log_violation(message.author, text_severity,
                    message.content, message.channel)
             await take_action(message, max_severity)
 
     except HttpResponseError as e:
-        print(f"[AZURE ERROR] {e}")
-    except Exception as e:
-        print(f"[ERROR] {e}")
-    
-    await bot.process_commands(message)
-    return True
+        log.error("azure_error", message=message.id, error=e)
+    except asyncio.TimeoutError:
+        log.warning("azure_timeout", message=message.id, timeout=AZURE_TIMEOUT)
+    except Exception:
+        log.exception("moderation_failed", message=message.id)
 
 @bot.tree.command(name="mute", description="Mute een gebruiker")
 @commands.has_permissions(manage_roles=True)
-async def mute(interaction: discord.Interaction, gebruiker: discord.Member, reden: str = "Geen reden opgegeven"):
+async def mute(interaction: discord.Interaction, gebruiker: discord.Member, reden: str = "Geen reden opgegeven", minuten: int = 0):
    
     # Controleer of de bot de gebruiker kan muten
     if gebruiker.top_role >= interaction.guild.me.top_role:
@@ -253,21 +1252,16 @@ async def mute(interaction: discord.Interaction, gebruiker: discord.Member, rede
         return
     
     # Zoek of maak een muted rol
-    muted_role = discord.utils.get(interaction.guild.roles, name="Muted")
-    if not muted_role:
-        try:
-            muted_role = await interaction.guild.create_role(name="Muted")
-            
-            # Pas permissies aan voor alle kanalen
-            for channel in interaction.guild.channels:
-                await channel.set_permissions(muted_role, send_messages=False, speak=False)
-        except discord.Forbidden:
-            await interaction.response.send_message("Ik heb geen permissies om een Muted rol te maken.", ephemeral=True)
-            return
+    try:
+        muted_role = await get_muted_role(interaction.guild)
+    except discord.Forbidden:
+        await interaction.response.send_message("Ik heb geen permissies om een Muted rol te maken.", ephemeral=True)
+        return
     
     # Mute de gebruiker
     try:
         await gebruiker.add_roles(muted_role, reason=f"Gemute door {interaction.user}: {reden}")
+        spawn(add_sanction(interaction.guild.id, gebruiker.id, "mute", minuten, reden))
     except discord.Forbidden:
         await interaction.response.send_message("Ik heb geen permissies om deze gebruiker te muten.", ephemeral=True)
         return
@@ -280,6 +1274,7 @@ async def mute(interaction: discord.Interaction, gebruiker: discord.Member, rede
             color=discord.Color.orange()
         )
         embed.add_field(name="Reden", value=reden, inline=False)
+        embed.add_field(name="Duur", value=format_duration(minuten), inline=False)
         embed.add_field(name="Unmute aanvragen", value="Neem contact op met @yassin1255 om een unmute aan te vragen.", inline=False)
         embed.set_footer(text=f"Gemute door {interaction.user}")
         
@@ -294,12 +1289,12 @@ async def mute(interaction: discord.Interaction, gebruiker: discord.Member, rede
         color=discord.Color.green()
     )
     embed.add_field(name="Reden", value=reden, inline=False)
+    embed.add_field(name="Duur", value=format_duration(minuten), inline=False)
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
     
     # Log naar het logkanaal
-    log_channel = bot.get_channel(LOG_CHANNEL_MODERATOR_ID)
-    if log_channel:
+    if LOG_CHANNEL_MODERATOR_ID:
         log_embed = discord.Embed(
             title="Mute Log",
             description=f"{gebruiker.mention} is gemute door {interaction.user.mention}",
@@ -307,14 +1302,14 @@ async def mute(interaction: discord.Interaction, gebruiker: discord.Member, rede
             timestamp=datetime.datetime.now(datetime.timezone.utc)
         )
         log_embed.add_field(name="Reden", value=reden, inline=False)
-        await log_channel.send(embed=log_embed)
+        log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
 
 
 @bot.tree.command(name="unmute", description="Unmute een gebruiker")
 @commands.has_permissions(manage_roles=True)
 async def unmute(interaction: discord.Interaction, gebruiker: discord.Member, reden: str = "Geen reden opgegeven"):
     
-    muted_role = discord.utils.get(interaction.guild.roles, name="Muted")
+    muted_role = find_muted_role(interaction.guild)
     
     if not muted_role or muted_role not in gebruiker.roles:
         await interaction.response.send_message(f"{gebruiker.mention} is niet gemute.", ephemeral=True)
@@ -322,6 +1317,7 @@ async def unmute(interaction: discord.Interaction, gebruiker: discord.Member, re
     
     try:
         await gebruiker.remove_roles(muted_role, reason=f"Geunmute door {interaction.user}: {reden}")
+        spawn(store.remove_sanction(interaction.guild.id, gebruiker.id, "mute"))
         
         # Stuur een DM naar de geunmute gebruiker
         try:
@@ -340,8 +1336,7 @@ async def unmute(interaction: discord.Interaction, gebruiker: discord.Member, re
         await interaction.response.send_message(f"{gebruiker.mention} is geunmute.", ephemeral=True )
         
         
-        log_channel = bot.get_channel(LOG_CHANNEL_MODERATOR_ID)
-        if log_channel:
+        if LOG_CHANNEL_MODERATOR_ID:
             embed = discord.Embed(
                 title="Unmute Log",
                 description=f"{gebruiker.mention} is geunmute door {interaction.user.mention}",
@@ -349,7 +1344,7 @@ async def unmute(interaction: discord.Interaction, gebruiker: discord.Member, re
                 timestamp=datetime.datetime.now(datetime.timezone.utc)
             )
             embed.add_field(name="Reden", value=reden, inline=False)
-            await log_channel.send(embed=embed)
+            log_sink.send(LOG_CHANNEL_MODERATOR_ID, embed)
             
     except discord.Forbidden:
         await interaction.response.send_message("Ik heb geen permissies om deze gebruiker te unmuten.", ephemeral=True)
@@ -401,8 +1396,7 @@ async def kick(interaction: discord.Interaction, gebruiker: discord.Member, rede
         await interaction.response.send_message(embed=confirm_embed, ephemeral=True)
         
         # Log naar het logkanaal
-        log_channel = bot.get_channel(LOG_CHANNEL_MODERATOR_ID)
-        if log_channel:
+        if LOG_CHANNEL_MODERATOR_ID:
             log_embed = discord.Embed(
                 title="Kick Log",
                 description=f"{gebruiker.mention} is gekicked door {interaction.user.mention}",
@@ -410,7 +1404,7 @@ async def kick(interaction: discord.Interaction, gebruiker: discord.Member, rede
                 timestamp=datetime.datetime.now(datetime.timezone.utc)
             )
             log_embed.add_field(name="Reden", value=reden, inline=False)
-            await log_channel.send(embed=log_embed)
+            log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
             
     except discord.Forbidden:
         await interaction.response.send_message(
@@ -421,7 +1415,7 @@ async def kick(interaction: discord.Interaction, gebruiker: discord.Member, rede
 
 @bot.tree.command(name="ban", description="Ban een gebruiker van de server")
 @commands.has_permissions(ban_members=True)
-async def ban(interaction: discord.Interaction, gebruiker: discord.Member, reden: str = "Geen reden opgegeven"):
+async def ban(interaction: discord.Interaction, gebruiker: discord.Member, reden: str = "Geen reden opgegeven", minuten: int = 0):
    
     
     # Controleer of de bot de gebruiker kan bannen
@@ -440,6 +1434,7 @@ async def ban(interaction: discord.Interaction, gebruiker: discord.Member, reden
                 color=discord.Color.red()
             )
             embed.add_field(name="Reden", value=reden, inline=False)
+            embed.add_field(name="Duur", value=format_duration(minuten), inline=False)
             embed.add_field(
                 name="Unban aanvragen", 
                 value="Neem contact op met een moderator en vermeld @yassin1255 om een unban aan te vragen.",
@@ -454,6 +1449,7 @@ async def ban(interaction: discord.Interaction, gebruiker: discord.Member, reden
         
         # Voer de ban uit
         await gebruiker.ban(reason=f"Verbannen door {interaction.user}: {reden}", delete_message_days=0)
+        spawn(add_sanction(interaction.guild.id, gebruiker.id, "ban", minuten, reden))
         
         # Bevestiging naar de moderator (ephemeral)
         confirm_embed = discord.Embed(
@@ -462,18 +1458,18 @@ async def ban(interaction: discord.Interaction, gebruiker: discord.Member, reden
             color=discord.Color.green()
         )
         confirm_embed.add_field(name="Reden", value=reden, inline=False)
+        confirm_embed.add_field(name="Duur", value=format_duration(minuten), inline=False)
         await interaction.response.send_message(embed=confirm_embed, ephemeral=True)
         
         # Log naar het logkanaal
-        log_channel = bot.get_channel(LOG_CHANNEL_MODERATOR_ID)
-        if log_channel:
+        if LOG_CHANNEL_MODERATOR_ID:
             log_embed = discord.Embed(
                 title="Ban Log",
                 description=f"{gebruiker.mention} is verbannen door {interaction.user.mention}",
                 color=discord.Color.red(),
                 timestamp=datetime.datetime.now(datetime.timezone.utc))
             log_embed.add_field(name="Reden", value=reden, inline=False)
-            await log_channel.send(embed=log_embed)
+            log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
             
     except discord.Forbidden:
         await interaction.response.send_message(
@@ -496,6 +1492,7 @@ async def unban(interaction: discord.Interaction, gebruiker_id: str, reden: str
     
     try:
         await interaction.guild.unban(gebruiker, reason=f"Unban door {interaction.user}: {reden}")
+        spawn(store.remove_sanction(interaction.guild.id, gebruiker.id, "ban"))
         
         # Bevestiging naar de moderator
         confirm_embed = discord.Embed(
@@ -507,15 +1504,14 @@ async def unban(interaction: discord.Interaction, gebruiker_id: str, reden: str
         await interaction.response.send_message(embed=confirm_embed, ephemeral=True)
         
         # Log naar het logkanaal
-        log_channel = bot.get_channel(LOG_CHANNEL_MODERATOR_ID)
-        if log_channel:
+        if LOG_CHANNEL_MODERATOR_ID:
             log_embed = discord.Embed(
                 title="Unban Log",
                 description=f"{gebruiker.mention} is geunbanned door {interaction.user.mention}",
                 color=discord.Color.green(),
                 timestamp=datetime.datetime.now(datetime.timezone.utc))
             log_embed.add_field(name="Reden", value=reden, inline=False)
-            await log_channel.send(embed=log_embed)
+            log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
             
     except discord.NotFound:
         await interaction.response.send_message(
@@ -528,79 +1524,470 @@ async def unban(interaction: discord.Interaction, gebruiker_id: str, reden: str
             ephemeral=True
         )
 
+@bot.tree.command(name="overtredingen", description="Toon de overtredingen van een gebruiker")
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+async def overtredingen(interaction: discord.Interaction, gebruiker: discord.Member):
+    
+    recent = await store.recent_infractions(interaction.guild.id, gebruiker.id, 10)
+    strikes = await store.count_infractions(interaction.guild.id, gebruiker.id, time.time() - STRIKE_WINDOW)
+
+    embed = discord.Embed(
+        title=f"Overtredingen van {gebruiker.display_name}",
+        description=f"**Laatste 30 dagen:** {strikes}",
+        color=discord.Color.orange()
+    )
+    if recent:
+        embed.add_field(
+            name="Recent",
+            value="\n".join(
+                f"<t:{int(created_at)}:R> - {content_type}, severity {severity}"
+                for severity, content_type, created_at in recent
+            ),
+            inline=False
+        )
+    else:
+        embed.add_field(name="Recent", value="Geen overtredingen gevonden.", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="modstats", description="Toon statistieken van de moderatie")
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+async def modstats(interaction: discord.Interaction):
+    
+    found = verdict_cache.hits + verdict_cache.db_hits
+    total = found + verdict_cache.misses
+    hit_rate = (found / total * 100) if total else 0
+
+    embed = discord.Embed(
+        title="📊 Moderatie Stats",
+        color=discord.Color.blurple()
+    )
+    embed.add_field(
+        name="Verdict cache",
+        value=(
+            f"**Hits:** {verdict_cache.hits}\n"
+            f"**Database hits:** {verdict_cache.db_hits}\n"
+            f"**Misses:** {verdict_cache.misses}\n"
+            f"**Hit rate:** {hit_rate:.1f}%\n"
+            f"**Entries:** {len(verdict_cache.entries)}/{verdict_cache.maxsize}"
+        ),
+        inline=False
+    )
+
+    processed = pipeline_stats["processed"]
+    avg_wait = (pipeline_stats["wait_total"] / processed * 1000) if processed else 0
+    embed.add_field(
+        name="Pipeline",
+        value=(
+            f"**Queue:** {moderation_queue.qsize()}/{MODERATION_QUEUE_SIZE} (max {pipeline_stats['max_depth']})\n"
+            f"**Verwerkt:** {processed}/{pipeline_stats['enqueued']}\n"
+            f"**Overload:** {pipeline_stats['overload']}\n"
+            f"**Gem. wachttijd:** {avg_wait:.1f} ms\n"
+            f"**Azure requests (tekst):** {text_batcher.requests} voor {text_batcher.texts} berichten"
+        ),
+        inline=False
+    )
+    now = time.monotonic()
+    embed.add_field(
+        name="Raid detectie",
+        value=(
+            f"**Joins:** {raid_detector.joins.rate(now) * 60:.1f}/min\n"
+            f"**Berichten:** {raid_detector.messages.rate(now):.1f}/s\n"
+            f"**Lockdown:** {'actief' if raid_detector.lockdown_active() else 'uit'} ({raid_detector.lockdowns}x)"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Sancties",
+        value=(
+            f"**Berichten verwijderd:** {sanction_executor.messages_deleted} in {sanction_executor.delete_calls} calls\n"
+            f"**Bans/kicks:** {sanction_executor.removals_done} (wachtend: {sanction_executor.removals.qsize()})"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Logs",
+        value=(
+            f"**Wachtend:** {log_sink.pending_count()}\n"
+            f"**Verstuurd:** {log_sink.embeds_sent} embeds in {log_sink.messages_sent} berichten"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Pre-filter",
+        value=(
+            f"**Lokaal goedgekeurd:** {prefilter_stats['allowed']}\n"
+            f"**Blocklist hits:** {prefilter_stats['blocked']}\n"
+            f"**Naar Azure:** {prefilter_stats['escalated']}"
+        ),
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 async def handle_slowmode(message):
   
     if message.author.bot or message.content.startswith(bot.command_prefix):
-        return await bot.process_commands(message)
+        return
 
     channel = message.channel
     channel_id = channel.id
 
     # Tel bericht mee
-    message_counts[channel_id] += 1
+    message_count = record_message(channel_id, time.monotonic())
 
-    # Start cooldown timer
-    asyncio.create_task(cooldown_counter(channel_id))
+    # Verhoog slowmode meteen als het drukker wordt, zakken gebeurt in de sweeper
+    level = slowmode_level(message_count)
+    state = slowmode_states.get(channel_id)
+    if level and (state is None or level > state.level):
+        if state is None:
+            state = slowmode_states[channel_id] = ChannelSlowmode(channel.slowmode_delay)
+        state.level = level
+        state.calm_since = None
+        await apply_slowmode(channel, state)
 
-    # Activeer slowmode indien nodig
-    if not channel_status[channel_id] and message_counts[channel_id] >= MSG_THRESHOLD:
-        await activate_slowmode(channel)
-    
-    await bot.process_commands(message)
-    return True
+def prune_window(window, now):
+    cutoff = now - TIME_WINDOW
+    while window and window[0] <= cutoff:
+        window.popleft()
 
-async def cooldown_counter(channel_id):
-    await asyncio.sleep(TIME_WINDOW)
-    message_counts[channel_id] -= 1
+def record_message(channel_id, now):
     
-    if message_counts[channel_id] <= 0:
-        message_counts[channel_id] = 0
-        channel = bot.get_channel(channel_id)
-        
-        if channel and channel_status[channel_id]:  
-            await deactivate_slowmode(channel) 
+    window = channel_windows.get(channel_id)
+    if window is None:
+        window = channel_windows[channel_id] = deque(maxlen=RATE_BUFFER_SIZE)
+    window.append(now)
+    prune_window(window, now)
+    return len(window)
 
-async def activate_slowmode(channel):
-    
-    channel_id = channel.id
-    channel_status[channel_id] = True
-    
-    # Bewaar originele slowmode
-    original_slowmode = channel.slowmode_delay
+class ChannelSlowmode:
+    # Toestand van de adaptieve slowmode in één kanaal
+
+    def __init__(self, original_slowmode):
+        self.original_slowmode = original_slowmode  # Delay van voor de bot ingreep, wordt exact hersteld
+        self.applied = original_slowmode            # Delay die nu echt op het kanaal staat
+        self.level = 0                              # 0 = uit, anders index + 1 in SLOWMODE_LEVELS
+        self.calm_since = None
+        self.last_edit = float("-inf")
+        self.announced = False                      # Enkel bij drukte in dit kanaal zelf, niet bij een lockdown
+        self.sweeping = False                       # De sweeper heeft al een edit voor dit kanaal lopen
+
+    def target_delay(self):
+        delay = self.original_slowmode
+        if self.level:
+            delay = max(delay, SLOWMODE_LEVELS[self.level - 1][1])
+        if raid_detector.lockdown_active():
+            delay = max(delay, LOCKDOWN_SLOWMODE)
+        return delay
+
+def slowmode_level(message_count):
+    level = 0
+    for index, (threshold, _) in enumerate(SLOWMODE_LEVELS):
+        if message_count >= threshold:
+            level = index + 1
+    return level
+
+async def apply_slowmode(channel, state):
+    # Zet de gewenste delay, maar nooit vaker dan één edit per EDIT_MIN_INTERVAL; de sweeper probeert later opnieuw
+    target = state.target_delay()
+    now = time.monotonic()
+    if target != state.applied and now - state.last_edit >= EDIT_MIN_INTERVAL:
+        state.last_edit = now
+        if target == state.original_slowmode and state.announced:
+            await deactivate_slowmode(channel, state.original_slowmode)
+            state.announced = False
+        elif target != state.original_slowmode and state.level and not state.announced:
+            await activate_slowmode(channel, target)
+            state.announced = True
+        else:
+            # Lockdown of een tussenstap: stil aanpassen, de lockdown heeft zijn eigen melding
+            await channel.edit(slowmode_delay=target)
+        state.applied = target
+
+    if target == state.original_slowmode and state.applied == state.original_slowmode:
+        slowmode_states.pop(channel.id, None)
+
+async def slowmode_sweeper():
+    # Eén task voor alle kanalen: ruimt lege vensters op en laat slowmode met hysteresis zakken
+    last_prune = time.monotonic()
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        now = time.monotonic()
+        if now - last_prune >= VERDICT_PRUNE_INTERVAL:
+            # Verlopen verdicts blijven anders tot de volgende herstart in de database staan
+            last_prune = now
+            spawn(store.prune_verdicts())
+        if raid_detector.lockdown_until and now >= raid_detector.lockdown_until:
+            end_lockdown()
+
+        for channel_id in list(channel_windows):
+            window = channel_windows[channel_id]
+            prune_window(window, now)
+            if not window:
+                del channel_windows[channel_id]
+
+        for channel_id, state in list(slowmode_states.items()):
+            message_count = len(channel_windows.get(channel_id, ()))
+            level = slowmode_level(message_count)
+            if level < state.level and message_count < SLOWMODE_LEVELS[state.level - 1][0] * SLOWMODE_LOW_RATIO:
+                if state.calm_since is None:
+                    state.calm_since = now
+                elif now - state.calm_since >= SLOWMODE_HOLD:
+                    state.level = level
+                    state.calm_since = None
+            else:
+                state.calm_since = None
+
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                slowmode_states.pop(channel_id, None)
+                continue
+            if state.sweeping:
+                continue
+            if state.target_delay() == state.applied:
+                if state.applied == state.original_slowmode:
+                    slowmode_states.pop(channel_id, None)
+                continue
+            if now - state.last_edit >= EDIT_MIN_INTERVAL:
+                state.sweeping = True
+                spawn(sweep_channel(channel, state))
+
+async def sweep_channel(channel, state):
+    # Buiten de sweeper loop: trage of rate-limited edits houden de andere kanalen en het einde van de lockdown niet op
+    try:
+        async with slowmode_edit_semaphore:
+            await apply_slowmode(channel, state)
+    except discord.HTTPException as e:
+        log.error("slowmode_edit_failed", channel=channel.id, error=e)
+    finally:
+        state.sweeping = False
+
+async def activate_slowmode(channel, delay=SLOWMODE_DURATION):
     
     # Pas slowmode aan
-    await channel.edit(slowmode_delay=SLOWMODE_DURATION)
-    warning_msg = await channel.send(
-        f"⏳ **Slowmode actief** ({SLOWMODE_DURATION}s/bericht)\n"
+    await channel.edit(slowmode_delay=delay)
+    await channel.send(
+        f"⏳ **Slowmode actief** ({delay}s/bericht)\n"
         f"*Te veel berichten in {TIME_WINDOW} seconden*", delete_after=10
     )
 
-async def deactivate_slowmode(channel, original_slowmode=0, warning_msg=None):
-    
-    channel_id = channel.id
-    channel_status[channel_id] = False
+async def deactivate_slowmode(channel, original_slowmode=NORMAL_SLOWMODE):
     
     await channel.edit(slowmode_delay=original_slowmode)
-    if warning_msg:
-        try:
-            await warning_msg.delete()
-        except:
-            pass
     await channel.send("✅ **Slowmode uitgeschakeld** (Chat is weer normaal)", delete_after=10)
 
-@bot.event
-async def on_message(message):
+class DecayingCounter:
+    # Exponentieel vervallende teller: geschat aantal events per seconde, O(1) per event
+
+    def __init__(self, half_life):
+        self.tau = half_life / math.log(2)
+        self.value = 0.0
+        self.updated = time.monotonic()
+
+    def add(self, now):
+        self.value = self.value * math.exp((self.updated - now) / self.tau) + 1
+        self.updated = now
+
+    def rate(self, now):
+        return self.value * math.exp((self.updated - now) / self.tau) / self.tau
+
+
+class CountMinSketch:
+    # Vaste hoeveelheid geheugen, telt (bij benadering) hoe vaak een sleutel voorkwam
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def indexes(self, key):
+        digest = hashlib.blake2b(key, digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[i * 4:i * 4 + 4], "little") % self.width for i in range(self.depth)]
+
+    def add(self, indexes):
+        for row, index in zip(self.rows, indexes):
+            row[index] += 1
+
+    def estimate(self, indexes):
+        return min(row[index] for row, index in zip(self.rows, indexes))
+
+
+class DuplicateTracker:
+    # Telt per inhoud hoeveel verschillende gebruikers ze binnen RAID_WINDOW stuurden.
+    # Twee generaties sketches: bij het roteren vervalt alles ouder dan twee vensters.
+
+    def __init__(self):
+        self.rotated_at = time.monotonic()
+        self.contents = [CountMinSketch(RAID_SKETCH_WIDTH, RAID_SKETCH_DEPTH) for _ in range(2)]
+        self.pairs = [CountMinSketch(RAID_SKETCH_WIDTH, RAID_SKETCH_DEPTH) for _ in range(2)]
+
+    def rotate(self, now):
+        if now - self.rotated_at < RAID_WINDOW:
+            return
+        self.rotated_at = now
+        self.contents = [CountMinSketch(RAID_SKETCH_WIDTH, RAID_SKETCH_DEPTH), self.contents[0]]
+        self.pairs = [CountMinSketch(RAID_SKETCH_WIDTH, RAID_SKETCH_DEPTH), self.pairs[0]]
+
+    def add(self, user_id, content_key, now):
+        self.rotate(now)
+        content_indexes = self.contents[0].indexes(content_key.encode())
+        pair_indexes = self.pairs[0].indexes(f"{user_id}:{content_key}".encode())
+        # Alleen meetellen als deze gebruiker dit bericht nog niet stuurde
+        if not any(sketch.estimate(pair_indexes) for sketch in self.pairs):
+            self.contents[0].add(content_indexes)
+        self.pairs[0].add(pair_indexes)
+        return sum(sketch.estimate(content_indexes) for sketch in self.contents)
+
+
+class RaidDetector:
+    # Server-brede signalen: joins, berichten en dezelfde inhoud van veel verschillende gebruikers
+
+    def __init__(self):
+        self.joins = DecayingCounter(RAID_JOIN_HALF_LIFE)
+        self.messages = DecayingCounter(RAID_MESSAGE_HALF_LIFE)
+        self.duplicates = DuplicateTracker()
+        self.lockdown_until = 0.0
+        self.lockdowns = 0
+
+    def lockdown_active(self):
+        return time.monotonic() < self.lockdown_until
+
+
+raid_detector = RaidDetector()
+
+async def start_lockdown(guild, reason):
+    
+    already_active = raid_detector.lockdown_active()
+    raid_detector.lockdown_until = time.monotonic() + LOCKDOWN_DURATION
+    if already_active:
+        return
+
+    raid_detector.lockdowns += 1
+    # Alle tekstkanalen onder beheer van de slowmode engine brengen, de sweeper voert de edits gespreid uit
+    for channel in guild.text_channels:
+        if channel.id not in slowmode_states:
+            slowmode_states[channel.id] = ChannelSlowmode(channel.slowmode_delay)
+
+    log.warning("lockdown_started", guild=guild.id, reason=reason)
+    if guild.system_channel is not None:
+        spawn(announce_lockdown(guild.system_channel))
+    if LOG_CHANNEL_MODERATOR_ID:
+        log_embed = discord.Embed(
+            title="🚨 Raid Lockdown",
+            description=f"Lockdown gestart: {reason}\nSlowmode {LOCKDOWN_SLOWMODE}s op alle kanalen, nieuwe leden worden gemute.",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.now(datetime.timezone.utc)
+        )
+        log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
+
+async def announce_lockdown(channel):
+    # Eén melding voor de hele server i.p.v. een slowmode bericht in elk kanaal
+    try:
+        await channel.send(
+            f"🔒 **Lockdown actief**: slowmode van {LOCKDOWN_SLOWMODE}s op alle kanalen "
+            f"terwijl we een raid afhandelen. Dit wordt automatisch opgeheven.", delete_after=LOCKDOWN_DURATION
+        )
+    except discord.HTTPException as e:
+        log.error("lockdown_notice_failed", channel=channel.id, error=e)
+
+def end_lockdown():
     
-    await handle_slowmode(message)
-    await handle_moderation(message)
+    raid_detector.lockdown_until = 0.0
+    log.info("lockdown_ended")
+    if LOG_CHANNEL_MODERATOR_ID:
+        log_embed = discord.Embed(
+            title="✅ Lockdown beëindigd",
+            description="De server is weer rustig, slowmode wordt hersteld.",
+            color=discord.Color.green(),
+            timestamp=datetime.datetime.now(datetime.timezone.utc)
+        )
+        log_sink.send(LOG_CHANNEL_MODERATOR_ID, log_embed)
+
+async def handle_raid(message):
+    # Enkel detectie: de berichten zelf gaan gewoon door de moderatie, waar de verdict cache herhalingen goedkoop maakt
+    if message.author.bot or not message.guild:
+        return
+
+    now = time.monotonic()
+    raid_detector.messages.add(now)
+    duplicates = 0
+    key = text_key(message.content)
+    if len(message.content) >= RAID_DUPLICATE_MIN_LENGTH:
+        duplicates = raid_detector.duplicates.add(message.author.id, key, now)
+
+    # Hetzelfde bericht van veel gebruikers is pas een raid als de inhoud zelf afgekeurd werd,
+    # een gedeeld "Proficiat met jullie diploma allemaal!" mag geen lockdown geven
+    severity = verdict_cache.peek(key) if duplicates >= RAID_DUPLICATE_USERS else None
+    if severity is not None and severity >= 2:
+        await start_lockdown(message.guild, f"{duplicates} gebruikers sturen hetzelfde afgekeurde bericht")
+    elif raid_detector.messages.rate(now) >= RAID_MESSAGE_RATE and not raid_detector.lockdown_active():
+        await start_lockdown(message.guild, "Extreem veel berichten")
+
+@bot.event
+async def on_member_join(member):
     
+    now = time.monotonic()
+    raid_detector.joins.add(now)
+    if raid_detector.joins.rate(now) >= RAID_JOIN_RATE and not raid_detector.lockdown_active():
+        await start_lockdown(member.guild, "Veel nieuwe leden in korte tijd")
+
+    if raid_detector.lockdown_active():
+        # Quarantaine: nieuwe leden tijdens een raid tijdelijk muten
+        try:
+            muted_role = await get_muted_role(member.guild)
+            await member.add_roles(muted_role, reason="Raid lockdown")
+            spawn(add_sanction(member.guild.id, member.id, "mute", LOCKDOWN_QUARANTINE, "Raid lockdown"))
+        except discord.Forbidden:
+            log.error("quarantine_failed", user=member.id)
+
+@bot.tree.command(name="lockdown", description="Zet de raid lockdown aan of uit")
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.checks.has_permissions(manage_guild=True)
+async def lockdown(interaction: discord.Interaction, aan: bool):
     
-    if not (message.author.bot or message.content.startswith(bot.command_prefix)):
-        await bot.process_commands(message)
+    if aan:
+        await start_lockdown(interaction.guild, f"Handmatig door {interaction.user}")
+        await interaction.response.send_message("🔒 Lockdown actief.", ephemeral=True)
+    else:
+        if raid_detector.lockdown_active():
+            end_lockdown()
+        await interaction.response.send_message("🔓 Lockdown uitgeschakeld.", ephemeral=True)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    # Zonder de juiste permissies: netjes weigeren i.p.v. een interactie die nooit antwoordt
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("Je hebt geen permissies om dit commando te gebruiken.", ephemeral=True)
+        return
+    log.error("app_command_failed", command=interaction.command.name if interaction.command else None, error=error)
+
+@bot.event
+async def on_message(message):
+    # Eén pipeline per bericht: rate tracking -> raid detectie -> moderatie -> commands (één keer geparsed)
+    for stage in (handle_slowmode, handle_raid, enqueue_moderation, bot.process_commands):
+        try:
+            await stage(message)
+        except Exception:
+            # Een falende stap (bv. een geweigerde slowmode edit) mag moderatie en commands niet overslaan
+            log.exception("on_message_stage_failed", stage=stage.__name__, message=message.id)
+
+@bot.event
+async def setup_hook():
+    await store.open()
+    await sanction_scheduler.rehydrate()
+    spawn(sanction_scheduler.run())
+
+    # Start de moderatie worker
+    spawn(moderation_worker())
+    spawn(slowmode_sweeper())
+    for _ in range(SANCTION_WORKERS):
+        spawn(sanction_executor.run())
+    log_sink.load()
+    spawn(log_sink.run())
 
 @bot.event
 async def on_ready():
-    print(f"Moderatorbot is online als {bot.user}")
+    log.info("ready", user=bot.user)
     
   
     try:
@@ -613,9 +2000,38 @@ async def on_ready():
         
         # Sync de commands met de specifieke guild
         await bot.tree.sync(guild=guild)
-        print(f"Slash commands succesvol gesynced voor guild {GUILD_ID}")
+        log.info("commands_synced", guild=GUILD_ID)
         
     except Exception as e:
-        print(f"Fout bij syncing commands: {str(e)}")
+        log.error("commands_sync_failed", error=e)
+
+    # Muted rol alvast opzoeken of aanmaken, zodat een mute later maar één API call is
+    guild = bot.get_guild(GUILD_ID)
+    if guild:
+        try:
+            await get_muted_role(guild)
+        except discord.Forbidden:
+            log.error("muted_role_forbidden", guild=GUILD_ID)
+
+@bot.event
+async def on_guild_role_delete(role):
+    if muted_roles.get(role.guild.id) == role:
+        del muted_roles[role.guild.id]
+
+@bot.event
+async def on_guild_channel_create(channel):
+    # Nieuwe kanalen meteen de Muted permissies geven
+    role = muted_roles.get(channel.guild.id)
+    if role is not None:
+        await apply_muted_overwrites(role, [channel])
+
+@bot.event
+async def close():
+    # Sluit de Azure sessie netjes af bij het stoppen van de bot
+    await content_safety_client.close()
+    image_pool.shutdown(wait=False, cancel_futures=True)
+    await log_sink.persist()
+    await store.close()
+    await commands.Bot.close(bot)
 
-bot.run(token)
\ No newline at end of file
+bot.run(token, log_handler=None)
\ No newline at end of file
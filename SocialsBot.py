@@ -1,6 +1,7 @@
 import os
 import discord
 from dotenv import load_dotenv
+from botlog import get_logger
 from discord import app_commands
 from discord.ext import commands
 from atproto import Client, models
@@ -16,6 +17,7 @@ from email.mime.image import MIMEImage
 
 
 load_dotenv()
+log = get_logger("SocialsBot")
 
 DISCORD_TOKEN = os.getenv("Discord_SocialsBot_Token")
 BSKY_HANDLE = os.getenv("BSKY_HANDLE")
@@ -63,7 +65,7 @@ def parse_bluesky_timestamp(timestamp_str):# voer deze functie kunnen we de time
             dt = dt.replace(tzinfo=datetime.timezone.utc)
         return dt
     except ValueError as e:
-        print(f"Fout bij parsen timestamp {timestamp_str}: {str(e)}")
+        log.error("timestamp_parse_failed", timestamp=timestamp_str, error=e)
         return None
 
 @bot.tree.command(name="statsvandaag", description="Toon stats van posts in de afgelopen 24 uur")
@@ -187,21 +189,21 @@ async def statsvandaag(interaction: discord.Interaction, email: str = None):
 
 @bot.event
 async def on_ready():
-    print(f"Bot is online als {bot.user}")
+    log.info("ready", user=bot.user)
     try:
         bsky_client.login(BSKY_HANDLE, BSKY_APP_PASSWORD)
-        print("Bluesky login succesvol")
+        log.info("bluesky_login")
         
         if GUILD_ID:
             guild = discord.Object(id=GUILD_ID)
             bot.tree.copy_global_to(guild=guild)
             await bot.tree.sync(guild=guild)
-            print(f"Commands gesynced voor guild {GUILD_ID}")
+            log.info("commands_synced", guild=GUILD_ID)
         else:
             await bot.tree.sync()
-            print("Globale commands gesynced")
+            log.info("commands_synced", guild="global")
     except Exception as e:
-        print(f"Bluesky login fout: {str(e)}")
+        log.error("bluesky_login_failed", error=e)
 
 async def download_media(url): # deze functie download de images die worden meegegeven later gebruikt in de post command
     response = requests.get(url)
@@ -375,4 +377,4 @@ async def stats(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"⚠️ Fout: {str(e)}", ephemeral=True)
 
-bot.run(DISCORD_TOKEN)
\ No newline at end of file
+bot.run(DISCORD_TOKEN, log_handler=None)
\ No newline at end of file
@@ -4,8 +4,10 @@ from discord.ext import commands
 from easy_pil import Editor, load_image_async, Font
 import os
 from dotenv import load_dotenv
+from botlog import get_logger
 
 load_dotenv()
+log = get_logger("WelcomeBot")
 token = os.getenv("Discord_WelcomBot_Token")
 
 
@@ -13,13 +15,13 @@ bot = commands.Bot(command_prefix='!', intents=discord.Intents.all())
 
 @bot.event
 async def on_ready():
-    print("welcomebot is online")
+    log.info("ready", user=bot.user)
 
 @bot.event 
 async def on_member_join(member):
     channel = bot.get_channel("WELCOME_CHANNEL_ID") 
     if channel is None:
-        print("Channel not found")
+        log.error("welcome_channel_missing")
         return
 
     background = Editor("images/thousandsunny.jpg")
@@ -47,6 +49,6 @@ async def simulate_join(ctx):
         await ctx.send("✅ Welkomstbericht gegenereerd!", delete_after=5)
     except Exception as e:
         await ctx.send(f"❌ Fout: {str(e)}", delete_after=15)
-        print(f"Test error: {e}")
+        log.error("simjoin_failed", error=e)
 
-bot.run(token)
\ No newline at end of file
+bot.run(token, log_handler=None)
\ No newline at end of file
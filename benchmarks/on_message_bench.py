@@ -0,0 +1,66 @@
+# Meet de CPU tijd van ModerationBot.on_message en hoe vaak commands per bericht worden geparsed.
+# Gebruik: python benchmarks/on_message_bench.py [aantal berichten]
+import asyncio
+import os
+import sys
+import time
+import types
+
+import discord
+
+# Dummy configuratie zodat ModerationBot importeert zonder .env, en geen verbinding met Discord
+for name, value in {
+    "GUILD_ID": "1", "LOG_CHANNEL_BOT": "2", "LOG_CHANNEL_MODERATOR": "3",
+    "Azure_Content_Safety_Endpoint": "https://example.cognitiveservices.azure.com",
+    "Azure_Content_Safety_Key": "benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+discord.Client.run = lambda self, *args, **kwargs: None
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ModerationBot as bot_module
+
+MESSAGE_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+class Channel:
+    id = 7
+    slowmode_delay = 0
+
+
+class Author:
+    bot = False
+    id = 5
+
+
+async def main():
+    bot = bot_module.bot
+    dispatches = 0
+    process_commands = bot.process_commands
+
+    async def counting_process_commands(message):
+        nonlocal dispatches
+        dispatches += 1
+        await process_commands(message)
+
+    bot.process_commands = counting_process_commands
+    bot._connection.user = types.SimpleNamespace(id=1)
+    # Geen slowmode edits en geen moderatie (guild=None): enkel de pipeline zelf wordt gemeten
+    bot_module.SLOWMODE_LEVELS[:] = [(10**9, 5)]
+
+    messages = [
+        types.SimpleNamespace(id=i, author=Author(), content="gewoon een bericht", channel=Channel(),
+                              guild=None, _state=bot._connection)
+        for i in range(MESSAGE_COUNT)
+    ]
+    start = time.process_time()
+    for message in messages:
+        await bot_module.on_message(message)
+    elapsed = time.process_time() - start
+
+    print(f"{MESSAGE_COUNT} berichten: {elapsed / MESSAGE_COUNT * 1e6:.1f} us CPU/bericht, "
+          f"{dispatches / MESSAGE_COUNT:.1f} command dispatches/bericht")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+# Gedeelde logging voor alle bots: gestructureerd (event + key=value), met niveaus,
+# en de echte I/O gebeurt in een aparte thread zodat de event loop nooit op de console wacht.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", 1.0))  # Fractie van de debug events die gelogd wordt
+LOG_FILE = os.getenv("LOG_FILE")  # Optioneel: ook naar een bestand loggen
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    # 2024-05-01 12:00:00 INFO ModerationBot action severity=3 type=text
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname} {record.name} {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={format_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def format_value(value):
+    text = str(value)
+    if not text or any(char.isspace() or char in '"=' for char in text):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+class EventLogger:
+    # Dunne laag rond een logging.Logger: log.info("event", key=value, ...)
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    @property
+    def debug_enabled(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def debug(self, event, **fields):
+        # Uitgeschakeld kost dit enkel een level check; aan wordt er gesampled
+        if self.logger.isEnabledFor(logging.DEBUG) and (LOG_DEBUG_SAMPLE >= 1 or random.random() < LOG_DEBUG_SAMPLE):
+            self.logger.debug(event, extra={"fields": fields})
+
+    def info(self, event, **fields):
+        self.logger.info(event, extra={"fields": fields})
+
+    def warning(self, event, **fields):
+        self.logger.warning(event, extra={"fields": fields})
+
+    def error(self, event, **fields):
+        self.logger.error(event, extra={"fields": fields})
+
+    def exception(self, event, **fields):
+        self.logger.exception(event, extra={"fields": fields})
+
+
+def setup_logging():
+    # Root logger schrijft enkel naar een queue, een QueueListener thread doet de echte output
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = StructuredFormatter()
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    setup_logging()
+    return EventLogger(logging.getLogger(name))